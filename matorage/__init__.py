@@ -14,7 +14,7 @@
 
 from matorage.data.config import DataConfig
 from matorage.data.attribute import DataAttribute
-from matorage.data.saver import DataSaver
+from matorage.data.saver import DataSaver, ParallelDataSaver
 
 from matorage.config import StorageConfig
 
@@ -26,6 +26,7 @@ __all__ = [
     "DataAttribute",
     "DataConfig",
     "DataSaver",
+    "ParallelDataSaver",
     "ModelConfig",
     "OptimizerConfig",
 ]
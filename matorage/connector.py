@@ -13,19 +13,32 @@
 # limitations under the License.
 
 from queue import Queue
-from threading import Thread
+from threading import Condition, Thread
 
 
 class MTRConnector(object):
     r""" File Storage Connector class with multi-thread.
         MinIO is thread-safety, according to document.
         Although Python Global Interpreter Lock(GIL), multi thread can benefit greatly from file IO.
+
+        The queue can be bounded by number of jobs(`max_queue_size`) and by bytes of jobs(`max_queue_bytes`).
+        When the budget is exhausted, `set_queue` blocks until workers finish previous jobs.
+        0 means unbounded.
+
+        A worker survives an error of a job, and the error is raised by next `join_queue`.
     """
 
-    def __init__(self, client, bucket, num_worker_threads):
+    def __init__(
+        self, client, bucket, num_worker_threads, max_queue_size=0, max_queue_bytes=0
+    ):
         self._client = client
         self._bucket = bucket
-        self._queue = Queue()
+        self._queue = Queue(maxsize=max_queue_size)
+
+        self._max_queue_bytes = max_queue_bytes
+        self._bytes_in_flight = 0
+        self._bytes_condition = Condition()
+        self._errors = []
 
         for i in range(num_worker_threads):
             _thread = Thread(target=self._worker)
@@ -34,9 +47,27 @@ class MTRConnector(object):
 
     def _worker(self):
         while True:
-            _local_file, _remote_file = self._queue.get()
-            self.do_job(_local_file, _remote_file)
-            self._queue.task_done()
+            _local_file, _remote_file, _nbytes = self._queue.get()
+            try:
+                self.do_job(_local_file, _remote_file)
+            except Exception as err:
+                self._errors.append(err)
+            finally:
+                with self._bytes_condition:
+                    self._bytes_in_flight -= _nbytes
+                    self._bytes_condition.notify_all()
+                self._queue.task_done()
+
+    def _get_nbytes(self, local_file):
+        """
+        Get bytes of a job which are counted in `max_queue_bytes`.
+
+        Returns:
+            :obj:`integer`: bytes of file image, 0 for filename.
+        """
+        if isinstance(local_file, (bytes, bytearray, memoryview)):
+            return memoryview(local_file).nbytes
+        return 0
 
     def set_queue(self, local_file, remote_file):
         """
@@ -46,11 +77,51 @@ class MTRConnector(object):
 
         Note:
             if `config.inmemory` mode is `False`, fileitem and filename is same.
+            This function blocks while the queue is over `max_queue_size` or `max_queue_bytes`.
+            A job larger than `max_queue_bytes` is accepted only when no other job is in flight.
 
         Returns:
             :None
         """
-        self._queue.put((local_file, remote_file,))
+        _nbytes = self._get_nbytes(local_file)
+        with self._bytes_condition:
+            while (
+                self._max_queue_bytes
+                and self._bytes_in_flight
+                and self._bytes_in_flight + _nbytes > self._max_queue_bytes
+            ):
+                self._bytes_condition.wait()
+            self._bytes_in_flight += _nbytes
+        self._queue.put((local_file, remote_file, _nbytes,))
 
     def join_queue(self):
+        """
+        Wait until all jobs are finished, and raise the first error of jobs since last call.
+
+        Returns:
+            :None
+        """
         self._queue.join()
+        if self._errors:
+            _errors, self._errors = self._errors, []
+            raise _errors[0]
+
+    @property
+    def queue_depth(self):
+        """
+        Number of jobs which are waiting or in progress.
+
+        Returns:
+            :obj:`integer`
+        """
+        return self._queue.unfinished_tasks
+
+    @property
+    def bytes_in_flight(self):
+        """
+        Bytes of jobs which are waiting or in progress.
+
+        Returns:
+            :obj:`integer`
+        """
+        return self._bytes_in_flight
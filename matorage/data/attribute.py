@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import copy
+import numbers
 from tables.atom import Atom, StringAtom
 
 from matorage.serialize import Serialize
@@ -43,6 +44,12 @@ class DataAttribute(Serialize):
             data attribute shape. For example, if you specify a shape with (2, 2), you can store an array of (B, 2, 2) shapes.
         itemsize (:obj:`integer`, optional, defaults to 0):
             itemsize(bytes) for string type attribute. Must be set for string type attribute.
+        chunk_rows (:obj:`integer` or :obj:`string`, optional, defaults to `None`):
+            number of rows in one HDF5 chunk. If `None`, pytables' default chunkshape is used.
+            If `'auto'`, it is chosen from the row size and `access_pattern` of ``DataConfig``.
+        compressor (:obj:`dict`, optional, defaults to `None`):
+            compressor option only for this attribute, it overrides `compressor` of ``DataConfig``.
+            For example, ``{"complevel": 5, "complib": "blosc:lz4", "bitshuffle": True}``.
 
     """
 
@@ -61,7 +68,7 @@ class DataAttribute(Serialize):
         "float64",
     ]
 
-    def __init__(self, name, type, shape, itemsize=0):
+    def __init__(self, name, type, shape, itemsize=0, chunk_rows=None, compressor=None):
 
         self.name = name
 
@@ -82,6 +89,24 @@ class DataAttribute(Serialize):
         else:
             self.shape = shape
 
+        if chunk_rows is not None and chunk_rows != "auto":
+            if (
+                not isinstance(chunk_rows, numbers.Integral)
+                or isinstance(chunk_rows, bool)
+                or chunk_rows < 1
+            ):
+                raise ValueError(
+                    "`chunk_rows` {} must be positive integer or 'auto'".format(
+                        chunk_rows
+                    )
+                )
+            chunk_rows = int(chunk_rows)
+        self.chunk_rows = chunk_rows
+
+        if compressor is not None and not isinstance(compressor, dict):
+            raise TypeError("`compressor` is not dict type")
+        self.compressor = compressor
+
     def to_dict(self):
         """
         Serializes this instance to a Python dictionary.
@@ -91,7 +116,7 @@ class DataAttribute(Serialize):
             >>> from matorage import DataAttribute
             >>> attribute = DataAttribute('array', 'uint8', (2, 2))
             >>> attribute.to_dict()
-            {'name': 'array', 'type': 'uint8', 'shape': (2, 2)}
+            {'name': 'array', 'type': 'uint8', 'shape': (2, 2), 'chunk_rows': None, 'compressor': None}
 
         Returns:
             :obj:`Dict[string, any]`: Dictionary of all the attributes that make up this configuration instance
@@ -0,0 +1,313 @@
+# Copyright 2020-present Tae Hwan Jung
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class ObjectCache(object):
+    r"""Local folder cache of objects of a bucket, which is shared by processes and jobs on a node.
+
+        An object is cached at `folder/object_name`. It is downloaded to a temporary file and renamed,
+        so a cached path which exists is always complete. A lock file per object makes only one of
+        threads and processes download it, and a lock file of the folder serializes eviction.
+
+        Modified time of a cached object is updated on every `fetch`, and the least recently fetched
+        objects are removed when total size of the folder is over `max_cache_size`.
+        The folder is scanned only when a running total of the last scan and objects downloaded since
+        then is over `max_cache_size`, so objects downloaded by other processes are counted at next scan.
+        Because an open file is still readable after it is removed on posix, eviction does not break
+        readers which already opened the object. Objects which are pinned by `pin` in current process,
+        such as prefetched objects which are not read yet, are never evicted.
+
+        Args:
+            folder (:obj:`str`, `require`):
+                folder path of cached objects.
+            max_cache_size (:obj:`integer`, `optional`, defaults to `0`):
+                bytes budget of the folder, 0 means unbounded.
+    """
+
+    _lock_suffix = ".lock"
+    _part_suffix = ".part"
+
+    def __init__(self, folder, max_cache_size=0):
+        self.folder = folder
+        self.max_cache_size = max_cache_size
+        self._total_size = 0
+        self._pinned = {}
+        self._pin_lock = Lock()
+        os.makedirs(self.folder, exist_ok=True)
+        if self.max_cache_size:
+            self.evict()
+
+    def path(self, object_name):
+        """
+        Get cached path of an object.
+
+        Returns:
+            :obj:`str`: cached path
+        """
+        return os.path.join(self.folder, object_name)
+
+    def fetch(self, object_name, download):
+        """
+        Get cached path of an object, download it with `download(path)` if it is not cached.
+
+        Returns:
+            :obj:`str`: cached path
+        """
+        _path = self.path(object_name)
+        if os.path.exists(_path):
+            self._touch(_path)
+            return _path
+
+        _size = 0
+        with self._lock(f"{_path}{self._lock_suffix}"):
+            if not os.path.exists(_path):
+                _part_path = f"{_path}.{uuid.uuid4().hex}{self._part_suffix}"
+                try:
+                    download(_part_path)
+                    _size = os.path.getsize(_part_path)
+                    os.replace(_part_path, _path)
+                finally:
+                    if os.path.exists(_part_path):
+                        os.remove(_part_path)
+        if self.max_cache_size:
+            self._total_size += _size
+            if self._total_size > self.max_cache_size:
+                self.evict(keep=_path)
+        return _path
+
+    def demote(self, object_name):
+        """
+        Make an object least recently fetched, so that it is evicted first,
+        and evict objects if total size is over `max_cache_size`.
+
+        Returns:
+            :obj: `None`:
+        """
+        try:
+            os.utime(self.path(object_name), (0, 0))
+        except FileNotFoundError:
+            pass
+        if self.max_cache_size and self._total_size > self.max_cache_size:
+            self.evict()
+
+    def pin(self, object_name):
+        """
+        Pin an object, so that it is not evicted until it is unpinned as many times.
+
+        Returns:
+            :obj: `None`:
+        """
+        _path = self.path(object_name)
+        with self._pin_lock:
+            self._pinned[_path] = self._pinned.get(_path, 0) + 1
+
+    def unpin(self, object_name):
+        """
+        Unpin an object which is pinned by `pin`.
+
+        Returns:
+            :obj: `None`:
+        """
+        _path = self.path(object_name)
+        with self._pin_lock:
+            self._pinned[_path] -= 1
+            if not self._pinned[_path]:
+                del self._pinned[_path]
+
+    def evict(self, keep=None):
+        """
+        Remove least recently fetched objects until total size is under `max_cache_size`.
+        `keep` and pinned objects are never removed.
+
+        Returns:
+            :obj: `None`:
+        """
+        with self._pin_lock:
+            _keep = set(self._pinned)
+        _keep.add(keep)
+        with self._lock(os.path.join(self.folder, self._lock_suffix)):
+            _objects = []
+            for _name in os.listdir(self.folder):
+                # storage clients may add their own suffix to part files.
+                if _name.endswith(self._lock_suffix) or self._part_suffix in _name:
+                    continue
+                _path = os.path.join(self.folder, _name)
+                try:
+                    _stat = os.stat(_path)
+                except FileNotFoundError:
+                    continue
+                _objects.append((_stat.st_mtime, _stat.st_size, _path))
+
+            _total_size = sum(_size for _, _size, _ in _objects)
+            for _, _size, _path in sorted(_objects):
+                if _total_size <= self.max_cache_size:
+                    break
+                if _path in _keep:
+                    continue
+                try:
+                    os.remove(_path)
+                except FileNotFoundError:
+                    pass
+                _total_size -= _size
+            self._total_size = _total_size
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def _lock(self, path):
+        with open(path, "a") as _lock:
+            if fcntl is not None:
+                fcntl.flock(_lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(_lock, fcntl.LOCK_UN)
+
+
+class HandleCache(object):
+    r"""In-process LRU cache of opened objects, bounded by total size measured by `sizeof`.
+
+        Size of an opened object is measured by `sizeof` whenever it is got, because an opened
+        object may hold more bytes as it is read, and total size is updated by the difference.
+        Least recently used objects are closed by `close` when total size is over `max_cache_size`,
+        while the latest one is always kept.
+        Without `sizeof`, the cache is bounded by number of opened objects.
+
+        Args:
+            max_cache_size (:obj:`integer`, `require`):
+                budget of total size of opened objects, 0 means unbounded.
+            close (:obj:`callable`, `require`):
+                function which closes an opened object.
+            sizeof (:obj:`callable`, `optional`, defaults to `None`):
+                function which returns size of an opened object, such as bytes. If `None`, size is 1.
+    """
+
+    def __init__(self, max_cache_size, close, sizeof=None):
+        self.max_cache_size = max_cache_size
+        self._sizeof = sizeof or (lambda _item: 1)
+        self._close = close
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._total_size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, open):
+        """
+        Get an opened object of `key`, open it with `open()` if it is not cached.
+
+        Returns:
+            opened object
+        """
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+        else:
+            self.misses += 1
+            self._items[key] = open()
+        _item = self._items[key]
+        _size = self._sizeof(_item)
+        self._total_size += _size - self._sizes.get(key, 0)
+        self._sizes[key] = _size
+        if self.max_cache_size:
+            self._evict()
+        return _item
+
+    def values(self):
+        """
+        Get opened objects from least recently used.
+
+        Returns:
+            :obj:`list`
+        """
+        return list(self._items.values())
+
+    @property
+    def nbytes(self):
+        """
+        Get total bytes of opened objects.
+
+        Returns:
+            :obj:`integer`
+        """
+        return sum(self._sizeof(_item) for _item in self._items.values())
+
+    def info(self):
+        """
+        Get statistics of cache.
+
+        Returns:
+            :obj:`dict`: hits, misses, evictions, number of objects and bytes.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "objects": len(self._items),
+            "bytes": self.nbytes,
+        }
+
+    def remove(self, key):
+        """
+        Close an opened object of `key` if it is cached.
+
+        Returns:
+            :obj: `None`:
+        """
+        if key in self._items:
+            self._total_size -= self._sizes.pop(key)
+            self._close(self._items.pop(key))
+
+    def clear(self):
+        """
+        Close all opened objects.
+
+        Returns:
+            :obj: `None`:
+        """
+        self._sizes.clear()
+        self._total_size = 0
+        while self._items:
+            self._close(self._items.popitem(last=False)[1])
+
+    def _evict(self):
+        while self._total_size > self.max_cache_size and len(self._items) > 1:
+            _key, _item = self._items.popitem(last=False)
+            self._total_size -= self._sizes.pop(_key)
+            self._close(_item)
+            self.evictions += 1
@@ -18,8 +18,15 @@ _KB = 1024
 _MB = 1024 * _KB
 """The size of a Megabyte in bytes"""
 
+_RANDOM_CHUNK_SIZE = 16 * _KB
+"""The size of a chunk chosen by `chunk_rows='auto'` for random access"""
+
+_SEQUENTIAL_CHUNK_SIZE = 1 * _MB
+"""The size of a chunk chosen by `chunk_rows='auto'` for sequential access"""
+
 import copy
 import json
+import numbers
 import tables
 import hashlib
 from minio import Minio
@@ -98,6 +105,7 @@ class DataConfig(StorageConfig):
             Set this value to True to enable secure (HTTPS) access. (Optional defaults to False unlike the original MinIO).
         max_object_size (:obj:`integer`, optional, defaults to `10MB`):
             One object file is divided into `max_object_size` and stored.
+            If compressor is used, stored(compressed) size of files is estimated from previously closed files.
 
         dataset_name (:obj:`string`, **require**):
             dataset name.
@@ -111,8 +119,31 @@ class DataConfig(StorageConfig):
 
             - complevel (:obj:`integer`, defaults to 0) : compressor level(0~9). The larger the number, the more compressed it is.
             - complib (:obj:`string`, defaults to 'zlib') : compressor library. choose in zlib, lzo, bzip2, blosc
+              or blosc sub-codecs such as blosc:lz4, blosc:lz4hc, blosc:zstd, blosc:zlib, blosc:blosclz
+            - shuffle (:obj:`boolean`, optional) : byte-shuffle filter, enabled by pytables when complevel > 0.
+            - bitshuffle (:obj:`boolean`, optional) : bit-shuffle filter, only for blosc.
+
+            Each ``DataAttribute`` can override this option with its own `compressor`.
+        statistics (:obj:`list`, optional, defaults to ``[]``):
+            Names of scalar attributes whose statistics(min, max, count and a small histogram)
+            are recorded for each object in metadata. Datasets can skip whole objects which cannot match
+            an `object_filter` with these statistics.
+        value_index (:obj:`list`, optional, defaults to ``[]``):
+            Names of scalar attributes which have a secondary index built at save time.
+            The index maps each value to the samples which hold it, so a dataset can select samples
+            with ``dataset.where(target=3)`` without reading every object.
+        compression_threads (:obj:`integer`, optional, defaults to `None`):
+            Number of threads used by blosc compressors to compress on ``DataSaver`` writes and
+            to decompress on reads. If `None`, pytables' default is used.
+            It is stored in metadata, and a config of an existing dataset uses it if not set.
+        access_pattern (:obj:`string`, optional, defaults to `'sequential'`):
+            Expected access pattern of the dataset, `'sequential'` or `'random'`.
+            It is used to choose the chunk size of attributes which have `chunk_rows='auto'`.
+            Small chunks make random single sample reads fast because a read only decompresses one chunk,
+            and large chunks make sequential reads and writes fast.
         max_object_size (:obj:`integer`, optional, defaults to `10MB`):
             One object file is divided into `max_object_size` and stored.
+            If compressor is used, stored(compressed) size of files is estimated from previously closed files.
 
     """
 
@@ -124,12 +155,17 @@ class DataConfig(StorageConfig):
         self.attributes = kwargs.pop("attributes", None)
         self.compressor = kwargs.pop("compressor", {"complevel": 0, "complib": "zlib"})
         self.max_object_size = kwargs.pop("max_object_size", 10 * _MB)
+        self.access_pattern = kwargs.pop("access_pattern", "sequential")
+        self.compression_threads = kwargs.pop("compression_threads", None)
+        self.statistics = kwargs.pop("statistics", [])
+        self.value_index = kwargs.pop("value_index", [])
 
         self.bucket_name = self._hashmap_transfer()
 
         self._check_all()
 
         self.metadata = DataMetadata(**self.__dict__)
+        self._indexer_last = 0
 
     def _check_all(self):
         """
@@ -155,6 +191,13 @@ class DataConfig(StorageConfig):
             if isinstance(attr, tuple):
                 self.attributes[i] = DataAttribute(attr[0], attr[1], attr[2])
 
+        if self.access_pattern not in ("sequential", "random"):
+            raise ValueError(
+                "access_pattern {} is not valid. select in "
+                "sequential, random".format(self.access_pattern)
+            )
+        self._set_chunk_rows()
+
         attribute_names = set()
         for attribute in self.attributes:
             assert isinstance(attribute.type, tables.atom.Atom)
@@ -169,16 +212,76 @@ class DataConfig(StorageConfig):
         self.flatten_attributes = copy.deepcopy(self.attributes)
         self._convert_type_flatten()
 
-        if self.compressor["complevel"] < 0 or 9 < self.compressor["complevel"]:
-            raise ValueError(
-                "Compressor level is {} must be 0-9 interger".format(
-                    self.compressor["level"]
+        self._check_compressor(self.compressor)
+        for attribute in self.attributes:
+            if attribute.compressor is not None:
+                self._check_compressor(attribute.compressor)
+
+        self._check_scalar_attributes(self.statistics, "statistics")
+        self._check_scalar_attributes(self.value_index, "value_index")
+
+        if self.compression_threads is not None:
+            if (
+                not isinstance(self.compression_threads, numbers.Integral)
+                or isinstance(self.compression_threads, bool)
+                or self.compression_threads < 1
+            ):
+                raise ValueError(
+                    "compression_threads {} must be positive integer".format(
+                        self.compression_threads
+                    )
+                )
+            self.compression_threads = int(self.compression_threads)
+
+    def _check_scalar_attributes(self, names, option):
+        """
+        Check names are scalar attributes which are not string type.
+
+        Returns:
+            :obj: `None`:
+        """
+        if not isinstance(names, list):
+            raise TypeError("{} is not list type".format(option))
+
+        attributes = {
+            attribute.name: attribute for attribute in self.flatten_attributes
+        }
+        for name in names:
+            if name not in attributes:
+                raise KeyError(
+                    "{} of {} is not exist in attributes".format(name, option)
+                )
+            if attributes[name].shape != (1,) or attributes[name].type.kind == "string":
+                raise ValueError(
+                    "{} of {} must be scalar and not string attribute".format(
+                        name, option
+                    )
+                )
+
+    def _check_compressor(self, compressor):
+        """
+        Check compressor option is fine.
+
+        Returns:
+            :obj: `None`:
+        """
+        for key in compressor.keys():
+            if key not in ("complevel", "complib", "shuffle", "bitshuffle"):
+                raise ValueError(
+                    "compressor option {} is not valid. select in "
+                    "complevel, complib, shuffle, bitshuffle".format(key)
                 )
+        _complevel = compressor.get("complevel", 0)
+        if _complevel < 0 or 9 < _complevel:
+            raise ValueError(
+                "Compressor level is {} must be 0-9 interger".format(_complevel)
             )
-        if self.compressor["complib"] not in ("zlib", "lzo", "bzip2", "blosc"):
+        _complib = compressor.get("complib", "zlib")
+        if _complib not in tables.filters.all_complibs:
             raise ValueError(
-                "compressor mode {} is not valid. select in "
-                "zlib, lzo, bzip2, blosc".format(self.compressor["lib"])
+                "compressor mode {} is not valid. select in {}".format(
+                    _complib, ", ".join(tables.filters.all_complibs)
+                )
             )
 
     def _check_bucket(self):
@@ -218,6 +321,13 @@ class DataConfig(StorageConfig):
                 )
 
             self.compressor = metadata_dict["compressor"]
+            self.access_pattern = metadata_dict.get(
+                "access_pattern", self.access_pattern
+            )
+            if self.compression_threads is None:
+                self.compression_threads = metadata_dict.get("compression_threads")
+            self.statistics = metadata_dict.get("statistics", self.statistics)
+            self.value_index = metadata_dict.get("value_index", self.value_index)
             self.attributes = [
                 DataAttribute(**item) for item in metadata_dict["attributes"]
             ]
@@ -226,6 +336,31 @@ class DataConfig(StorageConfig):
                 "{} {} is not exist!".format(self.dataset_name, str(self.additional))
             )
 
+    def _set_chunk_rows(self):
+        """
+        Resolve `chunk_rows='auto'` of attributes to number of rows.
+        A chunk is about `_RANDOM_CHUNK_SIZE` for random access or `_SEQUENTIAL_CHUNK_SIZE`
+        for sequential access, but not larger than one object.
+
+        Returns:
+            :obj: `None`:
+        """
+        if self.access_pattern == "random":
+            _chunk_size = _RANDOM_CHUNK_SIZE
+        else:
+            _chunk_size = _SEQUENTIAL_CHUNK_SIZE
+
+        for attribute in self.attributes:
+            if attribute.chunk_rows != "auto":
+                continue
+            _row_size = attribute.type.itemsize * reduce(
+                lambda x, y: x * y, attribute.shape
+            )
+            _object_rows = max(1, self.max_object_size // _row_size)
+            attribute.chunk_rows = int(
+                min(_object_rows, max(1, _chunk_size // _row_size))
+            )
+
     def _convert_type_flatten(self):
         for attribute in self.flatten_attributes:
             attribute.shape = (reduce(lambda x, y: x * y, attribute.shape),)
@@ -259,6 +394,10 @@ class DataConfig(StorageConfig):
         output["additional"] = self.metadata.additional
         output["attributes"] = [_attribute.to_dict() for _attribute in self.attributes]
         output["compressor"] = self.metadata.compressor
+        output["access_pattern"] = self.metadata.access_pattern
+        output["compression_threads"] = self.metadata.compression_threads
+        output["statistics"] = self.metadata.statistics
+        output["value_index"] = self.metadata.value_index
         return output
 
     @classmethod
@@ -282,13 +421,33 @@ class DataConfig(StorageConfig):
 
         return cls(**config_dict)
 
+    def get_compressor(self, attribute):
+        """
+        Get compressor option of the attribute, which is global `compressor` overridden by the attribute's `compressor`.
+
+        Returns:
+            :obj:`dict`: compressor option
+        """
+        compressor = dict(self.compressor)
+        if attribute.compressor is not None:
+            compressor.update(attribute.compressor)
+        return compressor
+
+    def set_compression_threads(self):
+        """
+        Set number of threads of blosc compressors in this process.
+
+        Returns:
+            :obj: `None`:
+        """
+        if self.compression_threads is not None:
+            tables.set_blosc_max_threads(self.compression_threads)
+
     def set_indexer(self, index):
         self.metadata.indexer.update(index)
+        if index:
+            self._indexer_last = max(self._indexer_last, max(index.keys()))
 
     @property
     def get_indexer_last(self):
-        keys = list(self.metadata.indexer.keys())
-        if len(keys) == 0:
-            return 0
-        else:
-            return keys[-1]
+        return self._indexer_last if self.metadata.indexer else 0
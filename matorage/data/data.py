@@ -12,18 +12,48 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+_KB = 1024
+"""The size of a Kilobyte in bytes"""
+
+_MB = 1024 * _KB
+"""The size of a Megabyte in bytes"""
+
 import os
 import io
 import json
 import atexit
 import bisect
 import tempfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
 from minio import Minio
 from os.path import expanduser
 
 from matorage.nas import NAS
-from matorage.utils import logger, check_nas
-from matorage.downloader import Downloader
+from matorage.utils import (
+    logger,
+    check_nas,
+    is_torch_available,
+    is_hdf5plugin_available,
+)
+from matorage.downloader import Downloader, RangeReader
+from matorage.data.cache import ObjectCache, HandleCache
+from matorage.data.manifest import read_indexes
+
+
+def _open_h5py(file):
+    """
+    Open a HDF5 file, file image or stream with h5py for reading.
+    Blosc and bzip2 filters are readable only if ``hdf5plugin`` is installed,
+    which is checked by ``MTRData`` in index mode.
+
+    Returns:
+        :obj:`h5py.File`
+    """
+    import h5py
+
+    return h5py.File(file, "r")
 
 
 class MTRData(object):
@@ -45,9 +75,43 @@ class MTRData(object):
             cache_folder_path (:obj:`str`, `optional`, defaults to `~/.matorage`):
                 cached folder path to check which files are downloaded complete.
             index (:obj:`boolean`, `optional`, defaults to `False`):
-                setting for index mode.
+                setting for index mode. Samples are read from storage with ranged requests,
+                without downloading objects.
+            object_filter (:obj:`dict`, `optional`, defaults to `None`):
+                skip whole objects which cannot match the filter, with `statistics` of ``DataConfig``.
+                key is attribute name and value is dict of operator(`eq`, `in`, `gt`, `ge`, `lt`, `le`) and operand.
+                For example, ``{"target": {"in": [3, 7]}, "timestamp": {"gt": 1600000000}}``.
+                Samples in remaining objects are not filtered.
+            lazy (:obj:`boolean`, `optional`, defaults to `False`):
+                Do not download all objects at start. An object is downloaded when it is accessed first,
+                only once even among processes of DataLoader workers.
+            max_cache_size (:obj:`integer`, `optional`, defaults to `None`):
+                If set, objects are kept in a persistent cache `cache_folder_path/bucket_name` which is shared by
+                processes and jobs on the node, and are not removed on exit. Least recently used objects are
+                removed when the cache is over `max_cache_size` bytes, 0 means unbounded.
+                If the dataset is larger than `max_cache_size`, use it with `lazy`.
+            max_memory_cache_size (:obj:`integer`, `optional`, defaults to `256MB`):
+                bytes budget of each process for objects opened in index mode and their fetched bytes.
+                Least recently used objects are closed over the budget, 0 means unbounded.
+                See ``cache_info`` for hit and miss counts.
+            shard (:obj:`boolean`, `optional`, defaults to `False`):
+                distributed sharded mode. Whole objects are assigned to ranks with balanced number of samples,
+                and a rank downloads only its objects. Use it with a sampler of the shard, such as
+                ``matorage.torch.ShardSampler``.
+            world_size (:obj:`integer`, `optional`, defaults to `None`):
+                number of ranks in sharded mode. If `None`, it is read from ``torch.distributed`` if initialized,
+                otherwise 1.
+            rank (:obj:`integer`, `optional`, defaults to `None`):
+                rank in sharded mode. If `None`, it is read from ``torch.distributed`` if initialized, otherwise 0.
+            shuffle_shards (:obj:`boolean`, `optional`, defaults to `False`):
+                reshuffle assignment of objects to ranks on every epoch with `shard_seed`.
+                Objects of a new assignment are downloaded on access.
+            shard_seed (:obj:`integer`, `optional`, defaults to `0`):
+                random seed of `shuffle_shards`, which must be same in all ranks.
     """
 
+    _object_filter_operators = ("eq", "in", "gt", "ge", "lt", "le")
+
     def __init__(
         self,
         config,
@@ -55,29 +119,74 @@ class MTRData(object):
         clear=True,
         cache_folder_path="~/.matorage",
         index=False,
+        object_filter=None,
+        lazy=False,
+        max_cache_size=None,
+        max_memory_cache_size=256 * _MB,
+        shard=False,
+        world_size=None,
+        rank=None,
+        shuffle_shards=False,
+        shard_seed=0,
     ):
         self.config = config
         self.attribute = self._set_attribute()
+        self.config.set_compression_threads()
 
         # Storage configuration
         self.num_worker_threads = num_worker_threads
         self.clear = clear
         self.index = index
+        self.lazy = lazy
+        self.max_cache_size = max_cache_size
+        self.max_memory_cache_size = max_memory_cache_size
+        self.object_filter = object_filter
+        self._check_object_filter()
+        if self.index:
+            self._check_h5py_filters()
+
+        self.shard = shard
+        self.shuffle_shards = shuffle_shards
+        self.shard_seed = shard_seed
+        self.world_size, self.rank = self._get_world(world_size, rank)
 
         self._check_bucket()
 
         # merge all metadatas and load in memory.
         self.merged_indexer = self._merge_metadata()
-        self.end_indices = list(self.merged_indexer.keys())
+        self.end_indices = np.fromiter(
+            self.merged_indexer.keys(), dtype=np.int64, count=len(self.merged_indexer)
+        )
+        self.start_indices = np.concatenate([[0], self.end_indices])[:-1]
+        self.object_names = list(self.merged_indexer.values())
+        self._shards = {}
+        if self.shard and len(self.object_names) < self.world_size:
+            raise ValueError(
+                "{} objects can't be sharded to {} ranks".format(
+                    len(self.object_names), self.world_size
+                )
+            )
 
         self._clients = {}
+        self._remote_files = {}
+        self._value_index = None
+        self._cache = None
 
         if not self.index:
             # cache object which is downloaded.
             self._caching(cache_folder_path=cache_folder_path)
 
-            # download all object in /tmp folder
-            self._init_download()
+            if self.lazy:
+                # objects are downloaded on first access.
+                self._init_object_paths()
+            elif self._cache is not None:
+                self._init_object_paths()
+                self._init_cache_download(
+                    [self.object_names[_object_id] for _object_id in self.get_shard()]
+                )
+            else:
+                # download all object in /tmp folder
+                self._init_download()
 
             atexit.register(self._exit)
 
@@ -89,12 +198,356 @@ class MTRData(object):
         self.cache_path = (
             f"{os.path.join(self.cache_folder_path, self.config.bucket_name)}.json"
         )
-        if os.path.exists(self.cache_path):
+        self._cache = None
+        if not check_nas(self.config.endpoint):
+            if self.max_cache_size is not None:
+                self._cache = ObjectCache(
+                    os.path.join(self.cache_folder_path, self.config.bucket_name),
+                    max_cache_size=self.max_cache_size,
+                )
+            elif self.lazy or self.shard:
+                self._cache = ObjectCache(
+                    os.path.join(
+                        tempfile.gettempdir(), "matorage", self.config.bucket_name
+                    )
+                )
+
+        # local paths of objects in `ObjectCache` are fixed, so they are not cached.
+        if os.path.exists(self.cache_path) and self._cache is None:
             with open(self.cache_path) as f:
                 self._object_file_mapper = json.load(f)
         else:
             self._object_file_mapper = {}
 
+    def _get_world(self, world_size, rank):
+        """
+        Get world size and rank of sharded mode, from ``torch.distributed`` if they are not given.
+
+        Returns:
+            :obj:`tuple`: world size and rank
+        """
+        if not self.shard:
+            return 1, 0
+        if world_size is None or rank is None:
+            world_size, rank = 1, 0
+            if is_torch_available():
+                import torch.distributed as dist
+
+                if dist.is_available() and dist.is_initialized():
+                    world_size, rank = dist.get_world_size(), dist.get_rank()
+        if not 0 <= rank < world_size:
+            raise ValueError(
+                "rank {} is not valid for world size {}".format(rank, world_size)
+            )
+        return world_size, rank
+
+    def get_shard(self, epoch=0, rank=None):
+        """
+        Get objects which are assigned to a rank.
+        Objects are assigned to the rank with the least samples in descending order of their samples,
+        so number of samples of ranks are balanced. All ranks compute the same assignment.
+        If `shuffle_shards`, tie order of objects is shuffled with `shard_seed` and `epoch`.
+
+        Returns:
+            :obj:`list`: sorted position of objects in `object_names`, all objects if not sharded.
+        """
+        if not self.shard:
+            return list(range(len(self.object_names)))
+        rank = self.rank if rank is None else rank
+        epoch = epoch if self.shuffle_shards else 0
+        if epoch not in self._shards:
+            _lengths = self.end_indices - self.start_indices
+            _objects = np.arange(len(_lengths))
+            if self.shuffle_shards:
+                _objects = np.random.RandomState(self.shard_seed + epoch).permutation(
+                    _objects
+                )
+            _objects = _objects[np.argsort(-_lengths[_objects], kind="stable")]
+
+            _totals = np.zeros(self.world_size, dtype=np.int64)
+            _shards = [[] for _ in range(self.world_size)]
+            for _object_id in _objects.tolist():
+                _rank = int(np.argmin(_totals))
+                _shards[_rank].append(_object_id)
+                _totals[_rank] += _lengths[_object_id]
+            self._shards[epoch] = [sorted(_shard) for _shard in _shards]
+        return self._shards[epoch][rank]
+
+    def _check_h5py_filters(self):
+        """
+        Check compressors of attributes are readable by h5py, which reads objects in index mode.
+        Blosc and bzip2 filters of pytables are registered to h5py by ``hdf5plugin``.
+
+        Returns:
+            :obj: `None`:
+        """
+        if is_hdf5plugin_available():
+            return
+        for attribute in self.config.attributes:
+            _compressor = attribute.compressor or self.config.compressor
+            _complib = _compressor.get("complib", "zlib")
+            if _compressor.get("complevel", 0) and (
+                _complib.startswith("blosc") or _complib == "bzip2"
+            ):
+                raise ImportError(
+                    "attribute {} is compressed with {}, which is read in index mode "
+                    "only if hdf5plugin is installed: `pip install hdf5plugin`".format(
+                        attribute.name, _complib
+                    )
+                )
+
+    def _check_object_filter(self):
+        """
+        Check `object_filter` is fine.
+
+        Returns:
+            :obj: `None`:
+        """
+        if self.object_filter is None:
+            return
+        if not isinstance(self.object_filter, dict):
+            raise TypeError("object_filter is not dict type")
+        for name, condition in self.object_filter.items():
+            if name not in self.config.statistics:
+                raise KeyError(
+                    "{} has no statistics, set `statistics` of DataConfig".format(name)
+                )
+            for operator in condition.keys():
+                if operator not in self._object_filter_operators:
+                    raise ValueError(
+                        "operator {} is not valid. select in {}".format(
+                            operator, ", ".join(self._object_filter_operators)
+                        )
+                    )
+
+    def _match_object_filter(self, index):
+        """
+        Check an object may have samples which match `object_filter`.
+        Objects without statistics are always matched.
+
+        Returns:
+            :obj:`boolean`
+        """
+        _statistics = index.get("statistics", {})
+        for name, condition in self.object_filter.items():
+            if name not in _statistics:
+                continue
+            _stat = _statistics[name]
+            for operator, operand in condition.items():
+                if operator == "eq" and not self._may_contain(_stat, operand):
+                    return False
+                if operator == "in" and not any(
+                    self._may_contain(_stat, value) for value in operand
+                ):
+                    return False
+                if operator == "gt" and not _stat["max"] > operand:
+                    return False
+                if operator == "ge" and not _stat["max"] >= operand:
+                    return False
+                if operator == "lt" and not _stat["min"] < operand:
+                    return False
+                if operator == "le" and not _stat["min"] <= operand:
+                    return False
+        return True
+
+    def _may_contain(self, statistics, value):
+        """
+        Check value is in range of statistics and its histogram bin is not empty.
+
+        Returns:
+            :obj:`boolean`
+        """
+        if not statistics["min"] <= value <= statistics["max"]:
+            return False
+        _counts = statistics["histogram"]["counts"]
+        _edges = statistics["histogram"]["edges"]
+        _bin = bisect.bisect_right(_edges, value) - 1
+        return _counts[min(max(_bin, 0), len(_counts) - 1)] > 0
+
+    def where(self, **conditions):
+        """
+        Select samples with value index of ``DataConfig``, without reading objects.
+        Value of a condition is a value or list of values, and conditions are combined with `and`.
+
+        Examples::
+
+            >>> subset = dataset.where(target=3)
+            >>> loader = DataLoader(subset, batch_size=64, shuffle=True)
+
+        Returns:
+            :obj:`matorage.data.data.IndexView`: view of dataset with selected indices.
+        """
+        if not conditions:
+            raise ValueError("where needs at least one condition")
+        for name in conditions.keys():
+            if name not in self.config.value_index:
+                raise KeyError(
+                    "{} has no value index, set `value_index` of DataConfig".format(
+                        name
+                    )
+                )
+        if self._value_index is None:
+            self._value_index = self._load_value_index()
+
+        # start index of each object in merged indexer, skipped objects are not in.
+        _starts = dict(zip(self.object_names, self.start_indices.tolist()))
+
+        selected = None
+        for name, value in conditions.items():
+            _values = value if isinstance(value, (list, tuple, set)) else [value]
+            _indices = [np.empty(0, dtype=np.int64)]
+            for _index in self._value_index:
+                if f"{name}.values" not in _index:
+                    continue
+                _object_starts = np.array(
+                    [_starts.get(_name, -1) for _name in _index["names"]],
+                    dtype=np.int64,
+                )
+                values, offsets = _index[f"{name}.values"], _index[f"{name}.offsets"]
+                for _value in _values:
+                    _pos = np.searchsorted(values, _value)
+                    if _pos == len(values) or values[_pos] != _value:
+                        continue
+                    _slice = slice(offsets[_pos], offsets[_pos + 1])
+                    _object_start = _object_starts[_index[f"{name}.objects"][_slice]]
+                    _rows = _index[f"{name}.rows"][_slice]
+                    _indices.append((_object_start + _rows)[_object_start >= 0])
+            _indices = np.unique(np.concatenate(_indices))
+            selected = (
+                _indices if selected is None else np.intersect1d(selected, _indices)
+            )
+        return IndexView(self, selected)
+
+    def _load_value_index(self):
+        """
+        Load all value indexes in `value_index/` folder of the bucket.
+
+        Returns:
+            :obj:`list` : list of dict of numpy arrays.
+        """
+        client = self._create_client()
+        objects = client.list_objects(self.config.bucket_name, prefix="value_index/")
+
+        value_index = []
+        for obj in objects:
+            data = client.get_object(
+                self.config.bucket_name, object_name=obj.object_name
+            )
+            with np.load(io.BytesIO(data.read())) as _index:
+                value_index.append(dict(_index))
+        return value_index
+
+    def prefetch_iter(self, indices=None, batch_size=None, num_prefetch_objects=2):
+        """
+        Iterate samples of `indices` in order, while the next `num_prefetch_objects` objects
+        are downloaded by a pool of `num_worker_threads` threads in background, which is shut down
+        when iteration ends. Downloads of objects overlap with consuming of the current object,
+        in `lazy` mode or with `max_cache_size`. Objects which are downloaded ahead are pinned in
+        the local cache until their last sample is consumed, so they are not evicted before read.
+        If `max_cache_size` is set to a disk budget, an object is closed as soon as its last sample
+        is consumed, and it is evicted first while the local cache is over the budget, so a dataset
+        larger than local disk can be streamed, while a dataset which fits the budget stays cached
+        for next iterations. The current and prefetched objects are kept even over the budget.
+
+        Examples::
+
+            >>> sampler = LocalitySampler(dataset, window=4)
+            >>> for image, target in dataset.prefetch_iter(list(sampler), batch_size=64):
+            ...     pass
+
+        Args:
+            indices (:obj:`iterable`, `optional`, defaults to `None`):
+                order of global indexes, for example from a sampler. If `None`, all samples in order.
+            batch_size (:obj:`integer`, `optional`, defaults to `None`):
+                if set, yield batches of `batch_size` indexes read at once, otherwise yield samples.
+            num_prefetch_objects (:obj:`integer`, `optional`, defaults to `2`):
+                number of upcoming objects which are downloaded ahead.
+
+        Returns:
+            :obj:`generator`
+        """
+        if indices is None:
+            indices = np.arange(self.end_indices[-1] if len(self.end_indices) else 0)
+        indices = np.asarray(list(indices), dtype=np.int64)
+        _step = batch_size or 1
+        _object_ids, _ = self.resolve(indices)
+
+        # objects in order of first use, and step of last use of each object.
+        _unique_ids, _first_uses = np.unique(_object_ids, return_index=True)
+        _order = _unique_ids[np.argsort(_first_uses)].tolist()
+        _ranks = {_object_id: _rank for _rank, _object_id in enumerate(_order)}
+        _finished = defaultdict(list)
+        for _object_id, _last_use in zip(
+            *np.unique(_object_ids[::-1], return_index=True)
+        ):
+            _finished[(len(indices) - 1 - _last_use) // _step].append(_object_id)
+
+        _executor = None
+        if self._cache is not None:
+            _executor = ThreadPoolExecutor(max_workers=self.num_worker_threads)
+        _demote = self._cache is not None and bool(self._cache.max_cache_size)
+
+        _futures = []
+        _pinned = set()
+        try:
+            for _batch_idx, _start in enumerate(range(0, len(indices), _step)):
+                _batch = indices[_start : _start + _step]
+                if _executor is not None:
+                    _rank = max(
+                        _ranks[_object_id]
+                        for _object_id in _object_ids[_start : _start + _step]
+                    )
+                    while len(_futures) < min(
+                        len(_order), _rank + num_prefetch_objects + 1
+                    ):
+                        _object_id = _order[len(_futures)]
+                        self._cache.pin(self.object_names[_object_id])
+                        _pinned.add(_object_id)
+                        _futures.append(
+                            _executor.submit(
+                                self._prefetch_object, self.object_names[_object_id]
+                            )
+                        )
+
+                yield self[_batch] if batch_size else self[int(_batch[0])]
+
+                for _object_id in _finished[_batch_idx]:
+                    if _object_id in _pinned:
+                        _pinned.remove(_object_id)
+                        self._cache.unpin(self.object_names[_object_id])
+                    if _demote:
+                        self._close_object(self.object_names[_object_id])
+                        self._cache.demote(self.object_names[_object_id])
+        finally:
+            if _executor is not None:
+                for _future in _futures:
+                    _future.cancel()
+                _executor.shutdown(wait=False)
+                for _object_id in _pinned:
+                    self._cache.unpin(self.object_names[_object_id])
+
+    def _prefetch_object(self, remote_file):
+        """
+        Download an object into the local cache ahead of its use by `prefetch_iter`.
+        A failed download is only logged, because the object is downloaded again when it is accessed.
+
+        Returns:
+            :obj: `None`:
+        """
+        try:
+            self._fetch_object(remote_file)
+        except Exception as err:
+            logger.warning("prefetch of {} failed: {}".format(remote_file, err))
+
+    def _close_object(self, objectname):
+        """
+        Close an opened local object, which is overridden by frameworks.
+
+        Returns:
+            :obj: `None`:
+        """
+        pass
+
     def _check_bucket(self):
         _client = self._create_client()
         if not _client.bucket_exists(self.config.bucket_name):
@@ -123,26 +576,180 @@ class MTRData(object):
         Returns:
             :obj:`str`: filename for index
         """
-        _key_idx = bisect.bisect_right(self.end_indices, index)
-        _key = self.end_indices[_key_idx]
-        _last_key = self.end_indices[_key_idx - 1] if _key_idx else 0
-        _relative_index = index - _last_key
-        return self.merged_indexer[_key], _relative_index
+        _object_id = int(self.end_indices.searchsorted(index, side="right"))
+        if index < 0 or _object_id >= len(self.end_indices):
+            raise IndexError("index out of range")
+        return (
+            self.object_names[_object_id],
+            int(index - self.start_indices[_object_id]),
+        )
 
-    def _get_item_with_inmemory(self, idx):
-        import h5py
+    def resolve(self, indices):
+        """
+        Resolve global indexes to objects and relative indexes in the objects at once,
+        with binary search of ``numpy.searchsorted`` on `end_indices`.
+
+        Examples::
 
+            >>> object_ids, relative_indices = dataset.resolve([0, 3335, 9999])
+            >>> [dataset.object_names[i] for i in object_ids]
+            ['tmpajivq0tw0923909106de4222.h5', 'tmp1g5zxyl0576b788d259844d1.h5', 'tmpqnkklb9u27395376c94d4c14.h5']
+            >>> relative_indices
+            array([   0,    0, 3329])
+
+        Returns:
+            :obj:`tuple` of :obj:`numpy.ndarray`: position of objects in `object_names`, relative indexes
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        _object_ids = np.searchsorted(self.end_indices, indices, side="right")
+        if indices.size and (
+            indices.min() < 0 or _object_ids.max() >= len(self.end_indices)
+        ):
+            raise IndexError("index out of range")
+        return _object_ids, indices - self.start_indices[_object_ids]
+
+    def _get_client(self):
+        """
+        Get storage client of current process.
+
+        Returns:
+            :obj:`Minio` or :obj:`matorage.nas.NAS`
+        """
         _pid = os.getpid()
         if _pid not in self._clients:
             self._clients[_pid] = self._create_client()
+        return self._clients[_pid]
 
-        _objectname, _relative_index = self._find_object(idx)
-        _file_image = (
-            self._clients[_pid]
-            .get_object(self.config.bucket_name, object_name=_objectname)
-            .read()
+    def _fetch_object(self, remote_file):
+        """
+        Get local path of an object. If objects are cached in `ObjectCache`,
+        download the object first when it is not cached.
+
+        Returns:
+            :obj:`str`: local path of the object
+        """
+        if self._cache is None:
+            return self._object_file_mapper[remote_file]
+        return self._cache.fetch(
+            remote_file,
+            lambda _local_file: self._get_client().fget_object(
+                self.config.bucket_name, remote_file, _local_file
+            ),
         )
-        _file_image = h5py.File(io.BytesIO(_file_image), "r")
+
+    def _open_remote(self, objectname):
+        """
+        Open an object in storage with h5py through `RangeReader`, without downloading whole object.
+        HDF5 metadata and only chunks of requested rows are fetched with ranged GET requests.
+        Opened objects are kept for each process.
+
+        Returns:
+            :obj:`h5py.File`
+        """
+
+        def _open():
+            _reader = RangeReader(
+                self._get_client(), self.config.bucket_name, objectname
+            )
+            return _open_h5py(_reader), _reader
+
+        return self._get_remote_files().get(objectname, _open)[0]
+
+    def _read_object(self, objectname):
+        """
+        Read all rows of an object from storage with one GET, without writing it to local storage.
+
+        Returns:
+            :obj:`dict`: attribute name as key and numpy array of all rows as value.
+        """
+        _response = self._get_client().get_object(self.config.bucket_name, objectname)
+        try:
+            _file_image = _response.read()
+        finally:
+            _response.close()
+            if hasattr(_response, "release_conn"):
+                _response.release_conn()
+
+        with _open_h5py(io.BytesIO(_file_image)) as _file:
+            return {
+                _attr_name: _file[_attr_name][()]
+                for _attr_name in self.attribute.keys()
+            }
+
+    def _iter_objects(self, object_ids, num_prefetch_objects=None):
+        """
+        Read objects in order of `object_ids` from storage with ``_read_object``.
+        Up to `num_prefetch_objects` next objects, `num_worker_threads` if `None`, are read ahead
+        by threads while the current object is consumed, so up to `num_prefetch_objects + 1`
+        whole objects are held in memory.
+        When the generator is closed early, reads which are not started are cancelled
+        without waiting for running reads.
+
+        Returns:
+            :obj:`generator`: tuple of object id and its arrays.
+        """
+        if num_prefetch_objects is None:
+            num_prefetch_objects = self.num_worker_threads
+        object_ids = list(object_ids)
+
+        executor = ThreadPoolExecutor(max_workers=self.num_worker_threads)
+        _futures = {}
+        try:
+            for _i, _object_id in enumerate(object_ids):
+                _last = min(_i + num_prefetch_objects + 1, len(object_ids))
+                for _j in range(_i, _last):
+                    if _j not in _futures:
+                        _futures[_j] = executor.submit(
+                            self._read_object, self.object_names[object_ids[_j]]
+                        )
+                yield _object_id, _futures.pop(_i).result()
+        finally:
+            for _future in _futures.values():
+                _future.cancel()
+            executor.shutdown(wait=False)
+
+    def _get_remote_files(self):
+        """
+        Get `HandleCache` of objects opened in index mode of current process.
+
+        Returns:
+            :obj:`matorage.data.cache.HandleCache`
+        """
+        _pid = os.getpid()
+        if _pid not in self._remote_files:
+            # objects opened by a parent process are not used by a forked process.
+            self._remote_files.clear()
+            self._remote_files[_pid] = HandleCache(
+                self.max_memory_cache_size,
+                sizeof=lambda _item: _item[1].cached_bytes,
+                close=lambda _item: _item[0].close(),
+            )
+        return self._remote_files[_pid]
+
+    def cache_info(self):
+        """
+        Get statistics of objects opened in index mode of current process.
+        `bytes_fetched` and `requests` are of objects which are opened now.
+
+        Examples::
+
+            >>> dataset.cache_info()
+            {'hits': 9998, 'misses': 2, 'evictions': 0, 'objects': 2, 'bytes': 2162688,
+             'bytes_fetched': 2162688, 'requests': 34}
+
+        Returns:
+            :obj:`dict`
+        """
+        _remote_files = self._get_remote_files()
+        _info = _remote_files.info()
+        _readers = [_item[1] for _item in _remote_files.values()]
+        _info["bytes_fetched"] = sum(_reader.bytes_fetched for _reader in _readers)
+        _info["requests"] = sum(_reader.requests for _reader in _readers)
+        return _info
+
+    def _get_item_with_inmemory(self, idx):
+        _objectname, _relative_index = self._find_object(idx)
+        _file_image = self._open_remote(_objectname)
 
         return_tensor = {}
         for _attr_name in list(self.attribute.keys()):
@@ -187,7 +794,9 @@ class MTRData(object):
                     )
         _downloader.join_queue()
 
-        assert len(self._object_file_mapper) == len(self.merged_indexer)
+        assert all(
+            _remote_file in self._object_file_mapper for _remote_file in _remote_files
+        )
 
         if not os.path.exists(self.cache_path):
             with open(self.cache_path, "w") as f:
@@ -198,6 +807,42 @@ class MTRData(object):
                 )
             )
 
+    def _init_object_paths(self):
+        """
+        Set local paths of objects which are not downloaded yet to `_object_file_mapper`.
+        Local paths are same among processes, so an object downloaded by a process is shared.
+        `_object_file_mapper` is not cached, because objects are downloaded by `_fetch_object`.
+
+        Returns:
+            :obj: `None`:
+        """
+        for _remote_file in self.merged_indexer.values():
+            if _remote_file in self._object_file_mapper:
+                continue
+            if self._cache is not None:
+                self._object_file_mapper[_remote_file] = self._cache.path(_remote_file)
+            else:
+                self._object_file_mapper[_remote_file] = os.path.join(
+                    self.config.endpoint, self.config.bucket_name, _remote_file
+                )
+
+    def _init_cache_download(self, remote_files):
+        """
+        Download objects which are not in `ObjectCache` with multi thread.
+
+        Returns:
+            :obj: `None`:
+        """
+        with ThreadPoolExecutor(max_workers=self.num_worker_threads) as executor:
+            list(executor.map(self._fetch_object, remote_files))
+        logger.info(
+            "All {} {} datasets are cached in {}.".format(
+                self.config.dataset_name,
+                str(self.config.additional),
+                self._cache.folder,
+            )
+        )
+
     def _exit(self):
         """
         Close all opened files and remove.
@@ -206,16 +851,22 @@ class MTRData(object):
             :obj: `None`:
         """
 
-        if self.clear and not check_nas(self.config.endpoint):
+        if (
+            self.clear
+            and self.max_cache_size is None
+            and not check_nas(self.config.endpoint)
+        ):
             for _local_file in list(self._object_file_mapper.values()):
-                if os.path.exists(_local_file):
-                    os.remove(_local_file)
+                for _file in [_local_file, f"{_local_file}.lock"]:
+                    if os.path.exists(_file):
+                        os.remove(_file)
             if os.path.exists(self.cache_path):
                 os.remove(self.cache_path)
 
     def _merge_metadata(self):
         """
         merge splited metadatas to a one file.
+        Metadatas are read from the consolidated manifest, see ``matorage.data.manifest``.
 
         Returns:
             :obj:`dict` : last end indexes with filename
@@ -227,23 +878,21 @@ class MTRData(object):
 
         """
         client = self._create_client()
-        objects = client.list_objects(self.config.bucket_name, prefix="metadata/")
+        total_index = [
+            _index
+            for _indexes in read_indexes(client, self.config.bucket_name).values()
+            for _index in _indexes
+        ]
 
-        total_index = []
-        for obj in objects:
-            metadata = client.get_object(
-                self.config.bucket_name, object_name=obj.object_name
-            )
-            local_indexer = json.loads(metadata.read().decode("utf-8"))["indexer"]
-            total_index.extend(list(local_indexer.values()))
+        if self.object_filter:
+            total_index = [
+                _index for _index in total_index if self._match_object_filter(_index)
+            ]
 
         reindexer = {}
+        key = 0
         for _index in total_index:
-            key = (
-                list(reindexer.keys())[-1] + _index["length"]
-                if reindexer
-                else _index["length"]
-            )
+            key += _index["length"]
             reindexer[key] = _index["name"]
 
         return reindexer
@@ -267,3 +916,25 @@ class MTRData(object):
                 "type": str(_attr.type.type),
             }
         return _attributes
+
+
+class IndexView(object):
+    r"""View of a dataset which holds only selected indices, made by ``MTRData.where``.
+        Sample `i` of the view is sample `indices[i]` of the dataset.
+
+        Args:
+            dataset (:obj:`matorage.data.data.MTRData`, `require`):
+                dataset which has `__getitem__`.
+            indices (:obj:`numpy.ndarray`, `require`):
+                sorted global indices of the dataset.
+    """
+
+    def __init__(self, dataset, indices):
+        self.dataset = dataset
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        return self.dataset[int(self.indices[idx])]
@@ -0,0 +1,130 @@
+# Copyright 2020-present Tae Hwan Jung
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import numpy as np
+from minio import ResponseError
+from minio.error import NoSuchKey
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_NAME = "manifest.npz"
+"""Object name of consolidated manifest in the bucket"""
+
+_NUM_METADATA_THREADS = 8
+
+
+def read_indexes(client, bucket_name):
+    """
+    Read indexes of objects of all metadata files in `metadata/` folder of the bucket.
+
+    Metadata files which are in the consolidated manifest are read from it with one GET, and only
+    metadata files which are not in it yet are read in parallel. Metadata files are ordered by name,
+    and indexes of a metadata file are ordered by its end index, so the order is same in all processes.
+
+    Returns:
+        :obj:`collections.OrderedDict` : metadata file name as key and list of indexes as value.
+        An index is a dict which has `name`, `length`, and optionally `statistics`.
+    """
+    _keys = sorted(
+        obj.object_name for obj in client.list_objects(bucket_name, prefix="metadata/")
+    )
+    _indexes = load_manifest(client, bucket_name)
+
+    def _read_metadata(key):
+        _metadata = client.get_object(bucket_name, object_name=key)
+        _indexer = json.loads(_metadata.read().decode("utf-8"))["indexer"]
+        return [_indexer[_end] for _end in sorted(_indexer.keys(), key=int)]
+
+    _missing = [_key for _key in _keys if _key not in _indexes]
+    if _missing:
+        with ThreadPoolExecutor(max_workers=_NUM_METADATA_THREADS) as executor:
+            _indexes.update(zip(_missing, executor.map(_read_metadata, _missing)))
+
+    return OrderedDict((_key, _indexes[_key]) for _key in _keys)
+
+
+def load_manifest(client, bucket_name):
+    """
+    Load the consolidated manifest of the bucket.
+
+    Returns:
+        :obj:`dict` : metadata file name as key and list of indexes as value, empty if there is no manifest.
+    """
+    try:
+        _manifest = client.get_object(bucket_name, object_name=MANIFEST_NAME).read()
+    except (NoSuchKey, ResponseError, FileNotFoundError):
+        return {}
+
+    with np.load(io.BytesIO(_manifest)) as _arrays:
+        _keys = _arrays["metadata_keys"].tolist()
+        _offsets = _arrays["key_offsets"].tolist()
+        _names = _arrays["names"].tolist()
+        _lengths = _arrays["lengths"].tolist()
+        _statistics = _arrays["statistics"].tolist()
+
+    _indexes = {}
+    for _i, _key in enumerate(_keys):
+        _indexes[_key] = []
+        for _j in range(_offsets[_i], _offsets[_i + 1]):
+            _index = {"name": _names[_j], "length": _lengths[_j]}
+            if _statistics[_j]:
+                _index["statistics"] = json.loads(_statistics[_j])
+            _indexes[_key].append(_index)
+    return _indexes
+
+
+def update_manifest(client, bucket_name):
+    """
+    Refresh the consolidated manifest with metadata files which are not in it yet, and upload it.
+    The manifest is a numpy `npz` file of
+
+    - `metadata_keys` : names of metadata files.
+    - `key_offsets` : objects of `metadata_keys[i]` are in `key_offsets[i]:key_offsets[i + 1]`.
+    - `names` : object names.
+    - `lengths` : number of samples of objects.
+    - `statistics` : statistics of objects in JSON string, empty string if not recorded.
+
+    Metadata files stay the source of truth. If savers update the manifest at the same time,
+    a metadata file missed by the manifest is still read from `metadata/` folder by readers.
+
+    Returns:
+        :obj: `None`:
+    """
+    _indexes = read_indexes(client, bucket_name)
+    _all_indexes = [_index for _key in _indexes for _index in _indexes[_key]]
+
+    _manifest = io.BytesIO()
+    np.savez(
+        _manifest,
+        metadata_keys=np.asarray(list(_indexes.keys()), dtype=str),
+        key_offsets=np.cumsum(
+            [0] + [len(_value) for _value in _indexes.values()], dtype=np.int64
+        ),
+        names=np.asarray([_index["name"] for _index in _all_indexes], dtype=str),
+        lengths=np.asarray(
+            [_index["length"] for _index in _all_indexes], dtype=np.int64
+        ),
+        statistics=np.asarray(
+            [
+                json.dumps(_index["statistics"]) if "statistics" in _index else ""
+                for _index in _all_indexes
+            ],
+            dtype=str,
+        ),
+    )
+    _length = _manifest.tell()
+    _manifest.seek(0)
+    client.put_object(bucket_name, MANIFEST_NAME, _manifest, _length)
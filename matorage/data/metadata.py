@@ -35,6 +35,13 @@ class DataMetadata(Serialize):
                     "47880": "tmpy3fwohhx178eb7c1d17d4a78.h5",
                     "60000": "tmpidco3y8u794f8adde1e5479a.h5"
                 }
+            If `statistics` attributes are set, each value also has statistics of the object.
+                "statistics": {
+                    "target": {
+                        "min": 0, "max": 9, "count": 15960,
+                        "histogram": {"counts": [...], "edges": [...]}
+                    }
+                }
     """
 
     def __init__(self, **kwargs):
@@ -44,6 +51,10 @@ class DataMetadata(Serialize):
 
         self.attributes = kwargs.pop("attributes", None)
         self.compressor = kwargs.pop("compressor", {"complevel": 0, "complib": "zlib"})
+        self.access_pattern = kwargs.pop("access_pattern", "sequential")
+        self.compression_threads = kwargs.pop("compression_threads", None)
+        self.statistics = kwargs.pop("statistics", [])
+        self.value_index = kwargs.pop("value_index", [])
 
         self.indexer = {}
 
@@ -12,19 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import os
-import sys
 import uuid
 import atexit
 import tempfile
+import traceback
 import tables as tb
 import numpy as np
+import multiprocessing
+from queue import Queue, Empty, Full
 from functools import reduce
+from threading import Event, Thread
 from minio import Minio
 
 from matorage.nas import NAS
 from matorage.utils import is_tf_available, is_torch_available, check_nas
 from matorage.uploader import Uploader
+from matorage.data.manifest import update_manifest
 
 _KB = 1024
 """The size of a Kilobyte in bytes"""
@@ -32,6 +37,26 @@ _KB = 1024
 _MB = 1024 * _KB
 """The size of a Megabyte in bytes"""
 
+_HISTOGRAM_BINS = 16
+"""The number of histogram bins of object statistics"""
+
+
+def _upload_metadata(client, config):
+    """
+    Upload metadata of config to `metadata/` folder of the bucket with unique key.
+
+    Returns:
+        :obj: `None`:
+    """
+    key = uuid.uuid4().hex[:16]
+    _metadata_file = tempfile.mktemp(f"{key}.json")
+    config.metadata.to_json_file(_metadata_file)
+    client.fput_object(config.bucket_name, f"metadata/{key}.json", _metadata_file)
+    os.remove(_metadata_file)
+
+    # refresh consolidated manifest, so datasets read all metadata with one GET.
+    update_manifest(client, config.bucket_name)
+
 
 class DataSaver(object):
     """
@@ -47,14 +72,17 @@ class DataSaver(object):
     .. code-block::
 
         per_one_batch_data_size = array_size // num_batch
+        if compressed:
+            per_one_batch_data_size *= stored_size_of_closed_files / raw_size_of_closed_files
         per_one_file_batch_size = max_object_size // per_one_batch_data_size
-        for batch_idx in range(num_batch):
-            if get_current_stored_batch_size() < per_one_file_batch_size:
-                file.append(data[batch_idx])
-            else:
+        start = 0
+        while start < num_batch:
+            if get_current_stored_batch_size() >= per_one_file_batch_size:
                 file_closing()
                 new_file is opened
-                new_file.append(data[batch_idx])
+            end = start + (per_one_file_batch_size - get_current_stored_batch_size())
+            file.append(data[start:end])
+            start = end
         All files are closed.
 
     Note:
@@ -79,6 +107,12 @@ class DataSaver(object):
             such as MinIO, is not stored on disk but is in the memory.
             Keep in mind that using memory is fast because it doesn't use disk IO, but it's not always good.
             If default option(False), then `HDF5_SEC2` driver will be used on posix OS(or `HDF5_WINDOWS` in Windows).
+        max_queue_size (:obj:`integer`, optional, defaults to 0):
+            Maximum number of files waiting in the upload queue. 0 means unbounded.
+        max_queue_bytes (:obj:`integer`, optional, defaults to 0):
+            Maximum bytes of files waiting in the upload queue. 0 means unbounded.
+            Saving blocks while the budget is exhausted, so memory usage is predictable in `inmemory` mode
+            when the backend storage is slower than the producer.
 
 
     Single Process example
@@ -118,6 +152,8 @@ class DataSaver(object):
         multipart_upload_size=5 * _MB,
         num_worker_threads=4,
         inmemory=False,
+        max_queue_size=0,
+        max_queue_bytes=0,
     ):
 
         self.config = config
@@ -125,11 +161,29 @@ class DataSaver(object):
         # Storage configuration
         self.multipart_upload_size = multipart_upload_size
         self.num_worker_threads = num_worker_threads
+        self.max_queue_size = max_queue_size
+        self.max_queue_bytes = max_queue_bytes
 
         # HDF5 configuration
         self.inmemory = inmemory
 
-        self.filter = tb.Filters(**config.compressor)
+        self.filters = {
+            attribute.name: tb.Filters(**config.get_compressor(attribute))
+            for attribute in config.flatten_attributes
+        }
+        config.set_compression_threads()
+
+        # raw size and stored(compressed) size of closed files
+        self._per_one_batch_data_size = 0
+        self._stored_raw_size = 0
+        self._stored_size = 0
+
+        # values of scalar attributes in the opened file, for statistics and index.
+        self._columns = {
+            name: [] for name in self.config.statistics + self.config.value_index
+        }
+        # (object name, values) of closed files for each value index attribute.
+        self._value_index = {name: [] for name in self.config.value_index}
 
         self._filelist = []
         self._file, self._earray = self._get_newfile()
@@ -154,6 +208,8 @@ class DataSaver(object):
             num_worker_threads=self.num_worker_threads,
             multipart_upload_size=self.multipart_upload_size,
             inmemory=self.inmemory,
+            max_queue_size=self.max_queue_size,
+            max_queue_bytes=self.max_queue_bytes,
         )
 
         atexit.register(self._exit)
@@ -176,19 +232,27 @@ class DataSaver(object):
         bzs = list(self._datas.values())[0].shape[0]
 
         per_one_batch_data_size = array_size // bzs
-        per_one_file_batch_size = max(
-            1, self.config.max_object_size // per_one_batch_data_size
-        )
-
-        for batch_idx in range(bzs):
-            if self._get_current_stored_batch_size() < per_one_file_batch_size:
-                for name, array in self._datas.items():
-                    self._earray[name].append(array[batch_idx, None])
-            else:
+        self._per_one_batch_data_size = per_one_batch_data_size
+
+        # Append as many rows as fit in the opened file with one contiguous slice
+        # per attribute, the batch is only split where the file is rotated.
+        _start = 0
+        while _start < bzs:
+            _stored = self._get_current_stored_batch_size()
+            if _stored >= self._get_per_one_file_batch_size(per_one_batch_data_size):
                 self._file_closing()
                 self._file, self._earray = self._get_newfile()
-                for name, array in self._datas.items():
-                    self._earray[name].append(array[batch_idx, None])
+                _stored = 0
+
+            per_one_file_batch_size = self._get_per_one_file_batch_size(
+                per_one_batch_data_size
+            )
+            _end = min(bzs, _start + per_one_file_batch_size - _stored)
+            for name, array in self._datas.items():
+                self._earray[name].append(array[_start:_end])
+            for name, column in self._columns.items():
+                column.append(self._datas[name][_start:_end, 0].copy())
+            _start = _end
 
     def _check_and_create_bucket(self):
         if not self._client.bucket_exists(self.config.bucket_name):
@@ -269,32 +333,154 @@ class DataSaver(object):
 
         self._append_all()
 
+    def save_from_iterable(self, iterable, prefetch=2):
+        """
+        Save all batches of iterable.
+        Batches are pulled from the iterable on a background thread while the previous batch is appended,
+        so work of the producer(decoding, augmentation, DB reads) overlaps with HDF5 writing.
+
+        Args:
+            iterable (:obj:`Iterable[Dict[str, numpy.ndarray]]`, **require**):
+                iterable which yields ``datas`` of ``__call__``.
+            prefetch (:obj:`integer`, optional, defaults to 2):
+                number of batches which are pulled ahead of the appended batch.
+
+        .. code-block:: python
+
+            def generator():
+                for _ in range(100):
+                    yield {
+                        'image' : np.random.rand(16, 28, 28),
+                        'target' : np.random.rand(16)
+                    }
+
+            data_saver = DataSaver(config=data_config)
+            data_saver.save_from_iterable(generator(), prefetch=4)
+            data_saver.disconnect()
+
+        Returns:
+            :None
+        """
+        _queue = Queue(maxsize=max(1, prefetch))
+        _stopped = Event()
+        # Unique end marker, so that a ``None`` batch can not end the stream early.
+        _end = object()
+
+        def _put(item):
+            while not _stopped.is_set():
+                try:
+                    _queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def _producer():
+            try:
+                for datas in iterable:
+                    if not _put((datas, None)):
+                        return
+                _put((_end, None))
+            except Exception as err:
+                _put((_end, err))
+
+        _thread = Thread(target=_producer)
+        _thread.daemon = True
+        _thread.start()
+
+        try:
+            while True:
+                datas, err = _queue.get()
+                if err is not None:
+                    raise err
+                if datas is _end:
+                    break
+                self(datas)
+        finally:
+            _stopped.set()
+
     def _file_closing(self):
         _length = len(list(self._earray.values())[0])
         _last_index = self.config.get_indexer_last
+        _filename = self._file.filename
+
+        self._finalize_file(self._file, _length)
 
+        # Set filename indexer
+        _current_index = _last_index + _length
+        _index = {
+            "name": os.path.basename(_filename),
+            "length": _length,
+        }
+        if self.config.statistics:
+            _index["statistics"] = self._get_statistics()
+        self.config.set_indexer({_current_index: _index})
+
+        for name in self.config.value_index:
+            if self._columns[name]:
+                self._value_index[name].append(
+                    (_index["name"], np.concatenate(self._columns[name]))
+                )
+
+        for column in self._columns.values():
+            column.clear()
+
+    def _get_statistics(self):
+        """
+        Get statistics of scalar attributes in the opened file.
+
+        Returns:
+            :obj:`dict`: min, max, count and histogram for each attribute
+            {
+                'target' : {
+                    'min': 0, 'max': 9, 'count': 100,
+                    'histogram': {'counts': [10, ..., 10], 'edges': [0.0, ..., 9.0]}
+                }
+            }
+        """
+        statistics = {}
+        for name in self.config.statistics:
+            if not self._columns[name]:
+                continue
+            values = np.concatenate(self._columns[name])
+            _min, _max = values.min(), values.max()
+            counts, edges = np.histogram(
+                values.astype(np.float64),
+                bins=_HISTOGRAM_BINS,
+                range=(float(_min), float(_max)),
+            )
+            statistics[name] = {
+                "min": _min.item(),
+                "max": _max.item(),
+                "count": int(values.shape[0]),
+                "histogram": {"counts": counts.tolist(), "edges": edges.tolist()},
+            }
+        return statistics
+
+    def _finalize_file(self, file, length):
+        """
+        Close the file and push it to the upload queue.
+        Stored size of the file is recorded to estimate compressed size of one batch.
+
+        Returns:
+            :None
+        """
         if not self.inmemory:
-            self._file.close()
+            file.close()
+            self._record_stored_size(length, os.path.getsize(file.filename))
             self._uploader.set_queue(
-                local_file=self._file.filename,
-                remote_file=os.path.basename(self._filename),
+                local_file=file.filename, remote_file=os.path.basename(file.filename),
             )
         else:
+            # The file image is the only copy of core driver buffer, and closing the file
+            # releases that buffer before the image waits in the upload queue.
+            _file_image = file.get_file_image()
+            file.close()
+            self._record_stored_size(length, len(_file_image))
             self._uploader.set_queue(
-                local_file=self._file.get_file_image(),
-                remote_file=os.path.basename(self._filename),
+                local_file=_file_image,
+                remote_file=os.path.basename(file.filename),
             )
-            self._file.close()
-        # Set filename indexer
-        _current_index = _last_index + _length
-        self.config.set_indexer(
-            {
-                _current_index: {
-                    "name": os.path.basename(self._filename),
-                    "length": _length,
-                }
-            }
-        )
 
     def _create_name(self, length=16):
         return tempfile.mktemp("{}.h5".format(uuid.uuid4().hex[:length]))
@@ -315,6 +501,37 @@ class DataSaver(object):
             size += array.nbytes
         return size
 
+    def _get_per_one_file_batch_size(self, per_one_batch_data_size):
+        """
+        Get number of batches which are stored in one file.
+        If data is compressed, the raw size of one batch is scaled with the ratio of stored size
+        to raw size of closed files, so that files are close to `max_object_size` after a few files.
+        The ratio is capped to 1, files never get fewer batches than raw size allows.
+
+        Returns:
+            :obj:`integer`: number of batches in one file.
+        """
+        if self._is_compressed() and self._stored_raw_size:
+            per_one_batch_data_size *= min(
+                1.0, max(self._stored_size, 1) / self._stored_raw_size
+            )
+        return max(1, int(self.config.max_object_size // per_one_batch_data_size))
+
+    def _record_stored_size(self, length, size):
+        """
+        Record raw size and stored size of a closed file.
+
+        Returns:
+            :None
+        """
+        if not length or not self._is_compressed():
+            return
+        self._stored_raw_size += length * self._per_one_batch_data_size
+        self._stored_size += size
+
+    def _is_compressed(self):
+        return any(_filter.complevel > 0 for _filter in self.filters.values())
+
     def _get_current_stored_batch_size(self):
         """
         Get current file stored batch size
@@ -337,10 +554,10 @@ class DataSaver(object):
         """
         _driver, _driver_core_backing_store = self._set_driver()
 
-        self._filename = self._create_name()
-        self._filelist.append(self._filename)
+        _filename = self._create_name()
+        self._filelist.append(_filename)
         file = tb.open_file(
-            self._filename,
+            _filename,
             "a",
             driver=_driver,
             driver_core_backing_store=_driver_core_backing_store,
@@ -354,16 +571,24 @@ class DataSaver(object):
                 _earray.name,
                 _earray.type,
                 shape=tuple([0]) + _earray.shape,
-                filters=self.filter,
+                filters=self.filters[_earray.name],
+                chunkshape=(
+                    tuple([_earray.chunk_rows]) + _earray.shape
+                    if _earray.chunk_rows
+                    else None
+                ),
             )
 
         return (file, earray)
 
     def _get_size(self):
-        if self.inmemory:
-            return sys.getsizeof(self._file.get_file_image())
-        else:
-            return self._file.get_filesize()
+        """
+        Get size of the opened file without copying the file image in `inmemory` mode.
+
+        Returns:
+            :obj:`integer`: file size(bytes)
+        """
+        return self._file.get_filesize()
 
     def _set_driver(self):
         """
@@ -393,21 +618,285 @@ class DataSaver(object):
         1. close all opened files.
         2. upload to backend storage.
 
+        Returns:
+            :obj: `None`:
+        """
+        self._flush_files()
+
+        # metadata set
+        _upload_metadata(client=self._client, config=self.config)
+
+    def _flush_files(self):
+        """
+        Close the opened file and wait until all files are uploaded.
+
         Returns:
             :obj: `None`:
         """
         self._file_closing()
         self._uploader.join_queue()
 
-        # metadata set
-        key = uuid.uuid4().hex[:16]
-        _metadata_file = tempfile.mktemp(f"{key}.json")
-        self.config.metadata.to_json_file(_metadata_file)
-        self._client.fput_object(
-            self.config.bucket_name, f"metadata/{key}.json", _metadata_file
+        if self.config.value_index:
+            self._upload_value_index()
+
+    def _upload_value_index(self):
+        """
+        Upload value index of closed files to `value_index/` folder of the bucket with unique key.
+        Value index is saved in numpy `npz` format, for each attribute
+
+        - `{name}.values` : sorted unique values.
+        - `{name}.offsets` : samples of `values[i]` are in `offsets[i]:offsets[i + 1]`.
+        - `{name}.objects` : object of samples, index of `names`.
+        - `{name}.rows` : row of samples in the object.
+
+        Returns:
+            :obj: `None`:
+        """
+        # position of each object name in `names`, in order of first appearance.
+        _positions = {}
+        _arrays = {}
+        for name, objects in self._value_index.items():
+            _values, _objects, _rows = [], [], []
+            for _objectname, values in objects:
+                _position = _positions.setdefault(_objectname, len(_positions))
+                _values.append(values)
+                _objects.append(np.full(len(values), _position))
+                _rows.append(np.arange(len(values)))
+            if not _values:
+                continue
+            _values = np.concatenate(_values)
+            _objects = np.concatenate(_objects)
+            _rows = np.concatenate(_rows)
+
+            order = np.lexsort((_rows, _objects, _values))
+            _arrays[f"{name}.values"], _starts = np.unique(
+                _values[order], return_index=True
+            )
+            _arrays[f"{name}.offsets"] = np.append(_starts, len(order))
+            _arrays[f"{name}.objects"] = _objects[order]
+            _arrays[f"{name}.rows"] = _rows[order]
+            objects.clear()
+
+        if not _positions:
+            return
+        _arrays["names"] = np.asarray(list(_positions))
+
+        _value_index = io.BytesIO()
+        np.savez(_value_index, **_arrays)
+        _length = _value_index.tell()
+        _value_index.seek(0)
+        self._client.put_object(
+            self.config.bucket_name,
+            "value_index/{}.npz".format(uuid.uuid4().hex[:16]),
+            _value_index,
+            _length,
         )
-        os.remove(_metadata_file)
 
     @property
     def get_disconnected(self):
         return self._disconnected
+
+
+def _parallel_saver_worker(rank, config, saver_kwargs, batch_queue, result_queue):
+    """
+    Worker process of `ParallelDataSaver`.
+    Save every batch from `batch_queue` with its own `DataSaver` until `None` is received,
+    then report its indexer instead of uploading metadata.
+
+    Returns:
+        :None
+    """
+    try:
+        data_saver = DataSaver(config=config, **saver_kwargs)
+        while True:
+            datas = batch_queue.get()
+            if datas is None:
+                break
+            data_saver(datas)
+        data_saver._flush_files()
+        result_queue.put(
+            (
+                rank,
+                list(config.metadata.indexer.values()),
+                data_saver.get_filelist,
+                None,
+            )
+        )
+    except Exception:
+        result_queue.put((rank, None, [], traceback.format_exc()))
+
+
+class ParallelDataSaver(object):
+    """
+    Dataset saver class which shards ingestion across worker processes.
+
+    Every worker process owns a ``DataSaver`` (its own HDF5 file and uploader),
+    so HDF5 writing and compression are not limited by the Global Interpreter Lock(GIL).
+    Batches are sent to the workers in round robin order. When disconnected, indexers
+    of all workers are merged in rank order and a single metadata is uploaded.
+
+    Note:
+        - Batch ``i`` is stored by the worker ``i % num_workers``, so the order of samples in dataset
+          is the order of samples of worker 0, then worker 1, and so on. For example, with 2 workers,
+          batches ``0, 1, 2, 3, 4`` are stored in order ``0, 2, 4, 1, 3``.
+          Use ``DataSaver`` if samples should be stored in input order.
+        - After data save is over, you must disconnect through the disconnect function.
+
+    Args:
+        config (:obj:`matorage.DataConfig`, **require**):
+            A DataConfig instance object
+        num_workers (:obj:`integer`, optional, defaults to 4):
+            number of worker processes.
+        max_pending_batches (:obj:`integer`, optional, defaults to 2):
+            number of batches which can wait for each worker. Calling this class blocks when it is full.
+        kwargs (optional):
+            ``DataSaver`` arguments such as ``multipart_upload_size``, ``num_worker_threads`` or ``inmemory``.
+
+    .. code-block:: python
+
+        import numpy as np
+        from matorage import DataConfig, ParallelDataSaver
+
+        data_config = DataConfig(
+            endpoint='127.0.0.1:9000',
+            access_key='minio',
+            secret_key='miniosecretkey',
+            dataset_name='array_test',
+            attributes=[
+                ('array', 'uint8', (3, 224, 224)),
+            ]
+        )
+
+        data_saver = ParallelDataSaver(config=data_config, num_workers=4)
+        data_saver.save_from_iterable(
+            {'array' : np.random.rand(64, 3, 224, 224)} for _ in range(100)
+        )
+        data_saver.disconnect()
+
+    """
+
+    def __init__(self, config, num_workers=4, max_pending_batches=2, **kwargs):
+        self.config = config
+        self.num_workers = num_workers
+
+        self._client = (
+            Minio(
+                endpoint=self.config.endpoint,
+                access_key=self.config.access_key,
+                secret_key=self.config.secret_key,
+                secure=self.config.secure,
+            )
+            if not check_nas(self.config.endpoint)
+            else NAS(self.config.endpoint)
+        )
+        # bucket is created before workers start, so that they don't race on it.
+        if not self._client.bucket_exists(self.config.bucket_name):
+            self._client.make_bucket(self.config.bucket_name)
+
+        self._filelist = []
+        self._next_rank = 0
+        self._result_queue = multiprocessing.Queue()
+        self._batch_queues = []
+        self._processes = []
+        for rank in range(self.num_workers):
+            _batch_queue = multiprocessing.Queue(maxsize=max_pending_batches)
+            _process = multiprocessing.Process(
+                target=_parallel_saver_worker,
+                args=(rank, self.config, kwargs, _batch_queue, self._result_queue),
+            )
+            _process.daemon = True
+            _process.start()
+            self._batch_queues.append(_batch_queue)
+            self._processes.append(_process)
+
+    def __call__(self, datas):
+        """
+
+        Args:
+            datas (:obj:`Dict[str, numpy.ndarray]`, **require**):
+                `value` is `numpy.ndarray` type with ``(B, d_1, d_2, ..., d_k)`` shape(B is batch size).
+
+        Returns:
+            :None
+        """
+        if not isinstance(datas, dict):
+            raise TypeError("datas shoud be dict type.", self.__call__.__doc__)
+
+        rank = self._next_rank
+        self._next_rank = (self._next_rank + 1) % self.num_workers
+        self._put(rank, datas)
+
+    def _put(self, rank, item):
+        """
+        Put item to the worker's queue, fail if the worker is dead instead of blocking forever.
+
+        Returns:
+            :None
+        """
+        while True:
+            try:
+                self._batch_queues[rank].put(item, timeout=1)
+                return
+            except Full:
+                if not self._processes[rank].is_alive():
+                    raise RuntimeError(
+                        "worker {} of ParallelDataSaver is dead".format(rank)
+                    )
+
+    def save_from_iterable(self, iterable):
+        """
+        Save all batches of iterable.
+
+        Args:
+            iterable (:obj:`Iterable[Dict[str, numpy.ndarray]]`, **require**):
+                iterable which yields ``datas`` of ``__call__``.
+
+        Returns:
+            :None
+        """
+        for datas in iterable:
+            self(datas)
+
+    @property
+    def get_filelist(self):
+        return self._filelist
+
+    def disconnect(self):
+        """
+        disconnecting all workers.
+
+        1. close all opened files in workers and upload to backend storage.
+        2. merge indexers of workers in rank order and upload a single metadata.
+
+        Returns:
+            :obj: `None`:
+        """
+        for rank in range(self.num_workers):
+            self._put(rank, None)
+
+        results = []
+        while len(results) < self.num_workers:
+            try:
+                results.append(self._result_queue.get(timeout=1))
+            except Empty:
+                if not any(_process.is_alive() for _process in self._processes):
+                    if self._result_queue.empty():
+                        raise RuntimeError("workers of ParallelDataSaver are dead")
+        for _process in self._processes:
+            _process.join()
+
+        errors = [error for _, _, _, error in results if error is not None]
+        if errors:
+            raise RuntimeError("\n".join(errors))
+
+        for _, indexer, filelist, _ in sorted(results, key=lambda result: result[0]):
+            self._filelist.extend(filelist)
+            for _index in indexer:
+                if not _index["length"]:
+                    continue
+                self.config.set_indexer(
+                    {self.config.get_indexer_last + _index["length"]: _index}
+                )
+
+        # metadata set
+        _upload_metadata(client=self._client, config=self.config)
@@ -14,6 +14,7 @@
 
 import os
 import io
+import numpy as np
 import tensorflow as tf
 import tensorflow_io as tfio
 
@@ -31,6 +32,8 @@ class Dataset(MTRData):
         When minio object is downloaded, it is recorded in _object_file_maper.
     2. We read ``_object_file_mapper`` and download only new objects that are not there.
     3. if Tensorflow v2(2.2.0>=), we use ``tfio.IODataset.from_hdf5`` and parallel ``interleave`` more fast
+    4. In index mode, ``dataloader`` reads whole objects from storage into memory without local download,
+        and yields batches through ``tf.data.Dataset.from_generator``.
 
     Args:
         config (:obj:`matorage.DataConfig`, **require**):
@@ -42,14 +45,50 @@ class Dataset(MTRData):
         cache_folder_path (:obj:`str`, optional, defaults to `~/.matorage`):
             Cached folder path to check which files are downloaded complete.
         index (:obj:`boolean`, optional, defaults to `False`):
-            Setting for index mode.
+            Setting for index mode. Objects are not downloaded to local storage, and ``dataloader`` reads
+            whole objects from storage with one GET each, `num_worker_threads` objects ahead.
+            Up to `num_worker_threads + 1` whole objects are held in memory.
+        object_filter (:obj:`dict`, optional, defaults to `None`):
+            Skip whole objects which cannot match the filter with object statistics,
+            For example, ``{"target": {"in": [3, 7]}}``. See `statistics` of ``DataConfig``.
+        lazy (:obj:`boolean`, optional, defaults to `False`):
+            Download an object when the dataloader reaches it, instead of all objects at start.
+        max_cache_size (:obj:`integer`, optional, defaults to `None`):
+            Bytes budget of persistent local object cache in `cache_folder_path`, which is reused
+            by later runs and evicted in least recently used order. 0 means unbounded.
+        shard (:obj:`boolean`, optional, defaults to `False`):
+            Sharded mode, which assigns whole objects to ranks with balanced samples.
+            The dataloader reads and downloads only objects of `rank` among `world_size`.
+        world_size (:obj:`integer`, optional, defaults to `None`):
+            Number of ranks in sharded mode, 1 if `None`.
+        rank (:obj:`integer`, optional, defaults to `None`):
+            Rank in sharded mode, 0 if `None`.
 
         batch_size (:obj:`integer`, `optional`, defaults to `1`):
-            how many samples per batch to load.
+            how many samples per batch to load. Samples of interleaved objects are batched together,
+            and the last incomplete batch is dropped.
         shuffle (:obj:`boolean`, `optional`, defaults to `False`):
             set to True to have the data reshuffled at every epoch.
         seed (:obj:`integer`, `optional`, defaults to `0`):
             random seed used to shuffle the sampler if ``shuffle=True``.
+        shuffle_buffer_size (:obj:`integer`, `optional`, defaults to `1000`):
+            size of shuffle buffer of samples of interleaved objects if ``shuffle=True``.
+        cycle_length (:obj:`integer`, `optional`, defaults to `None`):
+            number of objects which are read concurrently. If `None`, it is tuned by ``tf.data``,
+            and it is the number of CPUs if objects are downloaded on access(lazy, sharded or with
+            `max_cache_size`), so that objects which are open and downloaded ahead are bounded.
+        block_length (:obj:`integer`, `optional`, defaults to `1`):
+            number of consecutive samples which are read from an object before cycling to the next object.
+        num_parallel_calls (:obj:`integer`, `optional`, defaults to `tf.data.experimental.AUTOTUNE`):
+            number of threads which read objects in ``interleave``. If `None`, objects are read sequentially.
+        deterministic (:obj:`boolean`, `optional`, defaults to `True`):
+            if `False`, ``interleave`` yields samples of any object which is ready first, which trades
+            order of samples for throughput.
+        prefetch_size (:obj:`integer`, `optional`, defaults to `tf.data.experimental.AUTOTUNE`):
+            number of batches which are prefetched.
+
+        In index mode, ``interleave`` options are not used. If ``shuffle=True``, order of objects and
+        order of samples in an object are reshuffled at every epoch.
 
     .. code-block::
 
@@ -72,9 +111,19 @@ class Dataset(MTRData):
         for array in dataset.dataloader:
             print(array)
 
+        # read 8 objects in parallel, yielding samples in order of readiness.
+        dataset = Dataset(
+            config=data_config, batch_size=64, shuffle=True, cycle_length=8, deterministic=False
+        )
+
         # index mode
+        dataset = Dataset(config=data_config, index=True, batch_size=64, shuffle=True)
         print(dataset[0])
 
+        # stream batches from storage without local download
+        for array in dataset.dataloader:
+            print(array)
+
     """
 
     def __init__(self, config, batch_size=1, **kwargs):
@@ -83,7 +132,17 @@ class Dataset(MTRData):
         self._batch_size = batch_size
         self._shuffle = kwargs.pop("shuffle", False)
         self._seed = kwargs.pop("seed", 0)
-        self.index = kwargs.pop("index", False)
+        self._shuffle_buffer_size = kwargs.pop("shuffle_buffer_size", 1000)
+        self._cycle_length = kwargs.pop("cycle_length", None)
+        self._block_length = kwargs.pop("block_length", 1)
+        self._num_parallel_calls = kwargs.pop(
+            "num_parallel_calls", tf.data.experimental.AUTOTUNE
+        )
+        self._deterministic = kwargs.pop("deterministic", True)
+        self._prefetch_size = kwargs.pop(
+            "prefetch_size", tf.data.experimental.AUTOTUNE
+        )
+        self._epoch = 0
 
         super(Dataset, self).__init__(config, **kwargs)
 
@@ -91,9 +150,44 @@ class Dataset(MTRData):
             _dataset = tf.data.Dataset.from_tensor_slices(self.filenames)
             if self._shuffle:
                 _dataset = _dataset.shuffle(len(self.filenames), seed=self._seed)
-            self._dataloader = _dataset.interleave(
-                self._get_item_with_download, cycle_length=len(self.filenames)
+            if self._cache is not None:
+                if self._cycle_length is None:
+                    self._cycle_length = max(
+                        1, min(len(self.filenames), os.cpu_count() or 1)
+                    )
+                # download only objects which interleave opens next.
+                _dataset = _dataset.map(
+                    self._fetch_filename, num_parallel_calls=self._cycle_length
+                )
+            _dataset = _dataset.interleave(
+                self._get_item_with_download,
+                cycle_length=self._cycle_length,
+                block_length=self._block_length,
+                num_parallel_calls=self._num_parallel_calls,
+                deterministic=self._deterministic,
             )
+            if self._shuffle:
+                _dataset = _dataset.shuffle(self._shuffle_buffer_size, seed=self._seed)
+            self._dataloader = _dataset.batch(
+                self._batch_size, drop_remainder=True
+            ).prefetch(self._prefetch_size)
+        else:
+            _attr_names = list(self.attribute.keys())
+            self._dataloader = tf.data.Dataset.from_generator(
+                self._get_batches_with_storage,
+                output_types=tuple(
+                    tf.as_dtype(self.attribute[_attr_name]["type"])
+                    for _attr_name in _attr_names
+                ),
+                output_shapes=tuple(
+                    tf.TensorShape(
+                        [None]
+                        if list(self.attribute[_attr_name]["shape"]) == [1]
+                        else [None] + list(self.attribute[_attr_name]["shape"])
+                    )
+                    for _attr_name in _attr_names
+                ),
+            ).prefetch(self._prefetch_size)
 
     def __getitem__(self, idx):
         return self._get_item_with_inmemory(idx)
@@ -112,13 +206,79 @@ class Dataset(MTRData):
                     else x[0]
                 )
             )
-        _tfiodataset = tf.data.Dataset.zip(tuple(_tfios))
+        return tf.data.Dataset.zip(tuple(_tfios))
+
+    def _get_batches_with_storage(self):
+        """
+        Generator of batches in index mode, which is called by ``tf.data`` at every epoch.
+        Objects of the shard are read from storage in memory by ``_iter_objects``, and their samples
+        are batched over object boundaries. The last incomplete batch is dropped like ``dataloader``
+        of download mode.
+
+        Returns:
+            :obj:`generator`: tuple of numpy arrays of a batch, in order of attributes.
+        """
+        _generator = np.random.RandomState(self._seed + self._epoch)
+        _object_ids = list(self.get_shard(self._epoch))
+        self._epoch += 1
         if self._shuffle:
-            _tfiodataset = _tfiodataset.shuffle(1000, seed=self._seed)
-        _tfiodataset = _tfiodataset.batch(
-            self._batch_size, drop_remainder=True
-        ).prefetch(tf.data.experimental.AUTOTUNE)
-        return _tfiodataset
+            _generator.shuffle(_object_ids)
+
+        _attr_names = list(self.attribute.keys())
+        _pending = None
+        for _, _arrays in self._iter_objects(_object_ids):
+            _rows = [
+                self._reshape_batch(_arrays[_attr_name], _attr_name)
+                for _attr_name in _attr_names
+            ]
+            if self._shuffle:
+                _permutation = _generator.permutation(len(_rows[0]))
+                _rows = [_array[_permutation] for _array in _rows]
+            if _pending is not None:
+                _rows = [
+                    np.concatenate([_before, _after])
+                    for _before, _after in zip(_pending, _rows)
+                ]
+
+            _stop = len(_rows[0]) - len(_rows[0]) % self._batch_size
+            for _start in range(0, _stop, self._batch_size):
+                yield tuple(
+                    _array[_start : _start + self._batch_size] for _array in _rows
+                )
+            _pending = [_array[_stop:] for _array in _rows]
+
+    def _reshape_batch(self, numpy_array, attr_name):
+        """
+        Reshape stacked numpy array of (B, N) to shape of the attribute.
+        Scalar attributes are reshaped to (B, ) like samples of download mode.
+
+        Returns:
+            :obj:`numpy.ndarray`
+        """
+        _shape = self.attribute[attr_name]["shape"]
+        if list(_shape) == [1]:
+            return numpy_array.reshape(-1)
+        return numpy_array.reshape((-1,) + tuple(_shape))
+
+    def _fetch_filename(self, filename):
+        """
+        Download the object of a local filename if it is not cached.
+
+        Returns:
+            :obj:`tf.tensor`: local filename, which is downloaded.
+        """
+        _local_object_mapper = {
+            _local_file: _remote_file
+            for _remote_file, _local_file in self._object_file_mapper.items()
+        }
+        _filename = tf.py_function(
+            lambda f: self._fetch_object(
+                _local_object_mapper[f.numpy().decode("utf-8")]
+            ),
+            [filename],
+            tf.string,
+        )
+        return tf.ensure_shape(_filename, [])
 
     def _reshape_convert_tensor(self, numpy_array, attr_name):
         """
@@ -137,12 +297,15 @@ class Dataset(MTRData):
     @property
     def filenames(self):
         """
-        Get filenames(file absolute path) in local storage
+        Get filenames(file absolute path) in local storage, only of the shard in sharded mode
 
         Returns:
             :obj:`list`: filenames(file absolute path) in local storage
         """
-        return list(self._object_file_mapper.values())
+        return [
+            self._object_file_mapper[self.object_names[_object_id]]
+            for _object_id in self.get_shard()
+        ]
 
     @property
     def dataloader(self):
@@ -150,6 +313,7 @@ class Dataset(MTRData):
         Get iterative dataloader
 
         Returns:
-            :obj:`InterleaveDataset`:
+            :obj:`tf.data.Dataset`: batches of ``InterleaveDataset`` in download mode,
+            or batches of storage reads through ``from_generator`` in index mode.
         """
         return self._dataloader
@@ -15,8 +15,10 @@
 import os
 import torch
 import tables
+import numpy as np
 
 from matorage.data.data import MTRData
+from matorage.data.cache import HandleCache
 
 
 class Dataset(torch.utils.data.Dataset, MTRData):
@@ -40,13 +42,40 @@ class Dataset(torch.utils.data.Dataset, MTRData):
         cache_folder_path (:obj:`str`, optional, defaults to `~/.matorage`):
             Cached folder path to check which files are downloaded complete.
         index (:obj:`boolean`, optional, defaults to `False`):
-            Setting for index mode.
+            Setting for index mode. Samples are read from storage with ranged requests,
+            without downloading objects.
+        object_filter (:obj:`dict`, optional, defaults to `None`):
+            Skip whole objects which cannot match the filter with object statistics,
+            For example, ``{"target": {"in": [3, 7]}}``. See `statistics` of ``DataConfig``.
+        lazy (:obj:`boolean`, optional, defaults to `False`):
+            Download an object when a sample in it is accessed first, instead of all objects at start.
+        max_cache_size (:obj:`integer`, optional, defaults to `None`):
+            Bytes budget of persistent local object cache in `cache_folder_path`, which is reused
+            by later runs and evicted in least recently used order. 0 means unbounded.
+        shard (:obj:`boolean`, optional, defaults to `False`):
+            Sharded mode for distributed training. Whole objects are assigned to ranks with balanced samples,
+            and a rank downloads only its objects. Sample with ``matorage.torch.ShardSampler``.
+        world_size (:obj:`integer`, optional, defaults to `None`):
+            Number of ranks in sharded mode. If `None`, it is read from ``torch.distributed``.
+        rank (:obj:`integer`, optional, defaults to `None`):
+            Rank in sharded mode. If `None`, it is read from ``torch.distributed``.
+        shuffle_shards (:obj:`boolean`, optional, defaults to `False`):
+            Reshuffle assignment of objects to ranks on every epoch of ``ShardSampler``.
+        shard_seed (:obj:`integer`, optional, defaults to `0`):
+            Random seed of `shuffle_shards`, which must be same in all ranks.
+        mmap (:obj:`boolean`, optional, defaults to `False`):
+            Read uncompressed attributes from memory-mapped local files. A sample is copied from the page cache
+            without HDF5 decoding, so in-place operations on it do not change later reads or the file.
+            Compressed attributes are read with pytables.
+        max_open_files (:obj:`integer`, optional, defaults to `128`):
+            Maximum number of local files which are opened by each process. Files are opened on first access
+            to their objects, and least recently used files are closed over the maximum. 0 means unbounded.
 
     .. code-block::
 
         from matorage import DataConfig
         from matorage.torch import Dataset
-        from torch.utils.data import DataLoader
+        from torch.utils.data import DataLoader, BatchSampler, RandomSampler
 
         data_config = DataConfig(
             endpoint='127.0.0.1:9000',
@@ -67,36 +96,180 @@ class Dataset(torch.utils.data.Dataset, MTRData):
         # index mode
         print(dataset[0])
 
+        # batched read, samples in one object are read at once and tensors are stacked.
+        image, target = dataset[[0, 1, 2, 3]]
+
+        # with batch_size=None, DataLoader passes index lists from batch sampler
+        sampler = BatchSampler(RandomSampler(dataset), batch_size=64, drop_last=False)
+        for image, target in DataLoader(dataset, sampler=sampler, batch_size=None):
+            print(image.shape)
+
     """
 
-    def __init__(self, config, **kwargs):
+    def __init__(self, config, mmap=False, max_open_files=128, **kwargs):
+        if mmap and kwargs.get("index", False):
+            raise ValueError("mmap mode can't be used with index mode.")
+        if not isinstance(max_open_files, int) or max_open_files < 0:
+            raise ValueError(
+                "max_open_files should be a non-negative integer, not {}".format(
+                    max_open_files
+                )
+            )
+        self.mmap = mmap
+        self.max_open_files = max_open_files
+        self._open_files = {}
         super(Dataset, self).__init__(config, **kwargs)
-        self.open_files = {}
 
     def __len__(self):
-        return self.end_indices[-1]
+        return int(self.end_indices[-1])
 
     def __getitem__(self, idx):
+        if isinstance(idx, (list, tuple, np.ndarray, torch.Tensor)):
+            return self._get_items(idx)
         if not self.index:
             return self._get_item_with_download(idx)
         else:
             return self._get_item_with_inmemory(idx)
 
-    def _get_item_with_download(self, idx):
-        if not self.open_files:
-            self._pre_open_files()
+    def __getitems__(self, indices):
+        """
+        Batched read which DataLoader uses for a batch of indices with auto collation.
+        Samples are read by `_get_items` and split to be collated by ``collate_fn``,
+        in same types as ``__getitem__`` returns in the current mode.
 
+        Returns:
+            :obj:`list`: list of samples
+        """
+        _tensors = self._get_items(indices)
+        _columns = []
+        for _attr_name, _tensor in zip(self._get_attr_names(), _tensors):
+            _shape = self.attribute[_attr_name]["shape"]
+            if list(_shape) == [1] and not self.index:
+                # `_get_item_with_download` returns python scalars of scalar attributes.
+                _columns.append(_tensor.tolist())
+            else:
+                _columns.append(_tensor.reshape((-1,) + tuple(_shape)).unbind(0))
+        return [list(sample) for sample in zip(*_columns)]
+
+    def _get_items(self, indices):
+        """
+        Read samples of many indexes, grouped by object.
+        For each object, each attribute is read with one slice or coordinates read.
+
+        Returns:
+            :obj:`list`: list of stacked tensors, (B, ) for scalar attributes.
+        """
+        if isinstance(indices, torch.Tensor):
+            indices = indices.numpy()
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        _key_indices, _relative_indices = self.resolve(indices)
+        _objectnames = self.object_names
+
+        if not len(indices):
+            return [
+                self._reshape_convert_tensors(
+                    np.empty((0,), dtype=self.attribute[_attr_name]["type"]),
+                    _attr_name,
+                )
+                for _attr_name in self._get_attr_names()
+            ]
+
+        _outputs = {}
+        for _key_idx in np.unique(_key_indices):
+            _positions = np.nonzero(_key_indices == _key_idx)[0]
+            _rows = self._read_rows(
+                _objectnames[_key_idx], _relative_indices[_positions]
+            )
+            for _attr_name, _array in _rows.items():
+                if _attr_name not in _outputs:
+                    _outputs[_attr_name] = np.empty(
+                        (len(indices),) + _array.shape[1:], dtype=_array.dtype
+                    )
+                _outputs[_attr_name][_positions] = _array
+
+        return [
+            self._reshape_convert_tensors(_outputs[_attr_name], _attr_name)
+            for _attr_name in self._get_attr_names()
+        ]
+
+    def _read_rows(self, objectname, rows):
+        """
+        Read rows of an object for all attributes.
+        Rows are read with one slice if they are dense, otherwise with one slice per HDF5 chunk.
+
+        Returns:
+            :obj:`dict`: attribute name as key and numpy array of rows as value.
+        """
+        if not self.index:
+            _nodes = self._get_open_file(objectname)["nodes"]
+        else:
+            _file_image = self._open_remote(objectname)
+            _nodes = {
+                _attr_name: _file_image[_attr_name]
+                for _attr_name in self.attribute.keys()
+            }
+
+        _unique, _inverse = np.unique(rows, return_inverse=True)
+        _start, _stop = int(_unique[0]), int(_unique[-1]) + 1
+
+        _rows = {}
+        for _attr_name, _node in _nodes.items():
+            if _stop - _start == len(_unique):
+                _array = _node[_start:_stop]
+            elif _stop - _start <= 2 * len(_unique):
+                _array = _node[_start:_stop][_unique - _start]
+            else:
+                _array = self._read_chunkwise(_node, _unique)
+            _rows[_attr_name] = _array[_inverse]
+        return _rows
+
+    def _read_chunkwise(self, node, rows):
+        """
+        Read sorted unique rows with one slice per HDF5 chunk which has the rows.
+        A chunk is decompressed at once anyway, and slices are much faster than
+        point selection of HDF5.
+
+        Returns:
+            :obj:`numpy.ndarray`
+        """
+        _chunkshape = getattr(node, "chunkshape", None) or getattr(node, "chunks", None)
+        _chunk_rows = int(_chunkshape[0]) if _chunkshape else 1
+        _chunk_ids = rows // _chunk_rows
+        # `read` of pytables skips parsing of slice key.
+        _read = node.read if isinstance(node, tables.Leaf) else lambda s, e: node[s:e]
+
+        _arrays = []
+        for _group in np.split(rows, np.flatnonzero(np.diff(_chunk_ids)) + 1):
+            _start, _stop = int(_group[0]), int(_group[-1]) + 1
+            if _stop - _start == len(_group):
+                _arrays.append(_read(_start, _stop))
+            else:
+                _arrays.append(_read(_start, _stop)[_group - _start])
+        return np.concatenate(_arrays)
+
+    def _get_attr_names(self):
+        """
+        Get attribute names in order of returned samples.
+
+        Returns:
+            :obj:`list`: attribute names
+        """
+        if not self.index and len(self.open_files):
+            return self.open_files.values()[-1]["attr_names"]
+        return list(self.attribute.keys())
+
+    def _get_item_with_download(self, idx):
         _objectname, _relative_index = self._find_object(idx)
         if _objectname in self._object_file_mapper:
-            _open_file = self.open_files[_objectname]
-            _file = _open_file["file"]
+            _open_file = self._get_open_file(_objectname)
+            _nodes = _open_file["nodes"]
             _attr_names = _open_file["attr_names"]
 
             return_tensor = {}
             for _attr_name in _attr_names:
                 try:
                     return_tensor[_attr_name] = self._reshape_convert_tensor(
-                        numpy_array=_file.root[_attr_name][_relative_index],
+                        numpy_array=_nodes[_attr_name][_relative_index],
                         attr_name=_attr_name,
                     )
                     if list(return_tensor[_attr_name].size()) == [1]:
@@ -120,9 +293,16 @@ class Dataset(torch.utils.data.Dataset, MTRData):
             :obj: `None`:
         """
         super(Dataset, self)._exit()
-        for _file in list(self.open_files.values()):
-            if _file["file"].isopen:
-                _file["file"].close()
+        self.open_files.clear()
+
+    def _close_object(self, objectname):
+        """
+        Close opened file of an object.
+
+        Returns:
+            :obj: `None`:
+        """
+        self.open_files.remove(objectname)
 
     def _reshape_convert_tensor(self, numpy_array, attr_name):
         """
@@ -138,30 +318,103 @@ class Dataset(torch.utils.data.Dataset, MTRData):
         tensor = torch.from_numpy(numpy_array)
         return tensor
 
-    def _pre_open_files(self):
+    def _reshape_convert_tensors(self, numpy_array, attr_name):
         """
-        pre-open file for each processes.
-        This function call from individuallly all processes.
-        Because in Pytorch Multi Processing of DataLoader use `fork` mode.
+        Reshape stacked numpy tensor of (B, N) and convert from numpy to torch tensor.
+        Scalar attributes are reshaped to (B, ).
 
         Returns:
-            :None
+            :obj:`torch.tensor`
         """
-        if self.index:
-            raise FileNotFoundError("index mode can't not open files.")
+        _shape = self.attribute[attr_name]["shape"]
+        if list(_shape) == [1]:
+            numpy_array = numpy_array.reshape(-1)
+        else:
+            numpy_array = numpy_array.reshape((-1,) + tuple(_shape))
+        return torch.from_numpy(numpy_array)
 
-        _driver, _driver_core_backing_store = self._set_driver()
-        for _remote, _local in self._object_file_mapper.items():
-            _file = tables.open_file(
-                _local,
-                "r",
-                driver=_driver,
-                driver_core_backing_store=_driver_core_backing_store,
+    @property
+    def open_files(self):
+        """
+        Get `HandleCache` of local files opened by current process.
+        Files are opened in each process, because DataLoader workers are forked from the main process
+        and HDF5 file handles can't be shared among processes.
+
+        Returns:
+            :obj:`matorage.data.cache.HandleCache`
+        """
+        _pid = os.getpid()
+        if _pid not in self._open_files:
+            self._open_files[_pid] = HandleCache(
+                self.max_open_files,
+                close=lambda _open_file: _open_file["file"].close(),
             )
-            self.open_files[_remote] = {
-                "file": _file,
-                "attr_names": list(_file.get_node("/")._v_children.keys()),
-            }
+        return self._open_files[_pid]
+
+    def _get_open_file(self, remote):
+        """
+        Get opened local file of an object, open it if it is not opened by current process.
+
+        Returns:
+            :obj:`dict`: opened file, its attribute names and nodes.
+        """
+        return self.open_files.get(remote, lambda: self._open_file(remote))
+
+    def _open_file(self, remote):
+        """
+        Open local file of an object, download it first if it is not cached.
+
+        Returns:
+            :obj:`dict`: opened file, its attribute names and nodes.
+        """
+        _local = self._fetch_object(remote)
+        _driver, _driver_core_backing_store = self._set_driver()
+        _file = tables.open_file(
+            _local,
+            "r",
+            driver=_driver,
+            driver_core_backing_store=_driver_core_backing_store,
+        )
+        _attr_names = list(_file.get_node("/")._v_children.keys())
+        _nodes = {_attr_name: _file.root[_attr_name] for _attr_name in _attr_names}
+        if self.mmap:
+            _nodes.update(self._map_nodes(_local, _attr_names))
+        return {
+            "file": _file,
+            "attr_names": _attr_names,
+            "nodes": _nodes,
+        }
+
+    def _map_nodes(self, local, attr_names):
+        """
+        Map uncompressed attributes of a local file to memory.
+        Byte offsets of HDF5 chunks are resolved once, and a chunk is a view of the mapped file,
+        because an unfiltered chunk is stored as raw rows in C order.
+        The file is mapped read-only, and rows are copied out of the mapping when they are read.
+
+        Returns:
+            :obj:`dict`: attribute name as key and ``_MappedNode`` as value, only of mappable attributes.
+        """
+        import h5py
+
+        _buffer = None
+        _nodes = {}
+        with h5py.File(local, "r") as _file:
+            for _attr_name in attr_names:
+                _dataset = _file[_attr_name]
+                _offsets = _get_chunk_offsets(_dataset)
+                if _offsets is None:
+                    continue
+                if _buffer is None:
+                    _buffer = np.memmap(local, dtype=np.uint8, mode="r")
+                _nodes[_attr_name] = _MappedNode(
+                    _buffer,
+                    _dataset.dtype,
+                    _dataset.shape,
+                    (_dataset.chunks or _dataset.shape)[0],
+                    _offsets,
+                )
+        return _nodes
 
     def _set_driver(self):
         """
@@ -177,3 +430,112 @@ class Dataset(torch.utils.data.Dataset, MTRData):
             return "H5FD_WINDOWS", True
         else:
             raise ValueError("{} OS not supported!".format(os.name))
+
+
+def _get_chunk_offsets(dataset):
+    """
+    Get byte offsets of chunks of a h5py dataset in order of rows.
+
+    Returns:
+        :obj:`numpy.ndarray`: byte offsets, `None` if the dataset can't be mapped.
+        A dataset is mapped only if it is not filtered, and a chunk has whole rows.
+    """
+    if (
+        dataset.compression is not None
+        or dataset.shuffle
+        or dataset.fletcher32
+        or dataset.scaleoffset is not None
+        or dataset.shape[0] == 0
+    ):
+        return None
+
+    if dataset.chunks is None:
+        _offset = dataset.id.get_offset()
+        return None if _offset is None else np.asarray([_offset], dtype=np.int64)
+    if tuple(dataset.chunks[1:]) != tuple(dataset.shape[1:]):
+        return None
+
+    _chunk_rows = dataset.chunks[0]
+    _offsets = np.full(-(-dataset.shape[0] // _chunk_rows), -1, dtype=np.int64)
+
+    def _record(info):
+        if info.filter_mask == 0:
+            _offsets[info.chunk_offset[0] // _chunk_rows] = info.byte_offset
+
+    if hasattr(dataset.id, "chunk_iter"):
+        dataset.id.chunk_iter(_record)
+    else:
+        for _i in range(dataset.id.get_num_chunks()):
+            _record(dataset.id.get_chunk_info(_i))
+    # chunks which are not allocated or filtered are read with pytables.
+    return None if (_offsets < 0).any() else _offsets
+
+
+class _MappedNode(object):
+    """
+    Rows of an uncompressed HDF5 dataset in a read-only memory-mapped file.
+    Rows are copied out of the mapping, so returned arrays are writable and private to the caller.
+
+    Args:
+        buffer (:obj:`numpy.memmap`, **require**):
+            memory-mapped file as bytes.
+        dtype (:obj:`numpy.dtype`, **require**):
+            data type of the dataset.
+        shape (:obj:`tuple`, **require**):
+            shape of the dataset.
+        chunk_rows (:obj:`integer`, **require**):
+            number of rows of a chunk.
+        offsets (:obj:`numpy.ndarray`, **require**):
+            byte offsets of chunks in the file.
+    """
+
+    def __init__(self, buffer, dtype, shape, chunk_rows, offsets):
+        self.buffer = buffer
+        self.dtype = dtype
+        self.shape = tuple(shape)
+        self.chunks = (chunk_rows,) + self.shape[1:]
+        self.offsets = offsets
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        _chunk_rows = self.chunks[0]
+        if isinstance(key, slice):
+            _start, _stop, _step = key.indices(len(self))
+            if _step != 1:
+                raise IndexError("mapped rows support only contiguous slices.")
+            _arrays = [
+                self._chunk(_chunk_id)[
+                    max(_start - _chunk_id * _chunk_rows, 0) : _stop
+                    - _chunk_id * _chunk_rows
+                ]
+                for _chunk_id in range(_start // _chunk_rows, -(-_stop // _chunk_rows))
+            ]
+            if len(_arrays) == 1:
+                return _arrays[0].copy()
+            if not _arrays:
+                return np.empty((0,) + self.shape[1:], dtype=self.dtype)
+            return np.concatenate(_arrays)
+
+        key = int(key)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("row {} is out of range {}".format(key, len(self)))
+        return self._chunk(key // _chunk_rows)[key % _chunk_rows].copy()
+
+    def _chunk(self, chunk_id):
+        """
+        Read-only view of a chunk, rows over the dataset are cut in the last chunk.
+
+        Returns:
+            :obj:`numpy.ndarray`
+        """
+        _chunk = np.ndarray(
+            self.chunks,
+            dtype=self.dtype,
+            buffer=self.buffer,
+            offset=int(self.offsets[chunk_id]),
+        )
+        return _chunk[: len(self) - chunk_id * self.chunks[0]]
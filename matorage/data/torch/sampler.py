@@ -0,0 +1,194 @@
+# Copyright 2020-present Tae Hwan Jung
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+import numpy as np
+
+
+def _shuffle_in_windows(dataset, objects, window, generator):
+    """
+    Get indexes of objects in order of `objects`, which are shuffled in windows of `window` objects.
+
+    Returns:
+        :obj:`numpy.ndarray`
+    """
+    _windows = []
+    for _offset in range(0, len(objects), window):
+        _indices = np.concatenate(
+            [
+                np.arange(dataset.start_indices[_object], dataset.end_indices[_object])
+                for _object in objects[_offset : _offset + window]
+            ]
+        )
+        generator.shuffle(_indices)
+        _windows.append(_indices)
+    return np.concatenate(_windows) if _windows else np.empty(0, dtype=np.int64)
+
+
+class LocalitySampler(torch.utils.data.Sampler):
+    """
+    Shuffle sampler which respects object boundaries of ``matorage.torch.Dataset``.
+
+    The order of objects is shuffled, and objects are grouped into windows of `window` objects.
+    Samples are shuffled only inside a window, so a window reads only `window` objects while
+    the order is still close to random. This keeps HDF5 chunk cache warm and makes lazy
+    datasets fetch objects one after another.
+
+    Args:
+        dataset (:obj:`matorage.torch.Dataset`, **require**):
+            dataset which has `start_indices` and `end_indices`.
+        window (:obj:`int`, optional, defaults to `4`):
+            number of objects whose samples are shuffled together.
+        shuffle (:obj:`boolean`, optional, defaults to `True`):
+            if `False`, samples are yielded in order.
+        seed (:obj:`int`, optional, defaults to `0`):
+            random seed, which is added to epoch set by ``set_epoch``.
+
+    .. code-block::
+
+        from torch.utils.data import DataLoader
+        from matorage.torch import Dataset, LocalitySampler
+
+        dataset = Dataset(config=data_config, lazy=True)
+        sampler = LocalitySampler(dataset, window=4, seed=0)
+        loader = DataLoader(dataset, batch_size=64, sampler=sampler)
+
+        for epoch in range(10):
+            sampler.set_epoch(epoch)
+            for image, target in loader:
+                pass
+
+    """
+
+    def __init__(self, dataset, window=4, shuffle=True, seed=0):
+        if not isinstance(window, int) or window < 1:
+            raise ValueError(
+                "window should be a positive integer, not {}".format(window)
+            )
+        self.dataset = dataset
+        self.window = window
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def __iter__(self):
+        _end_indices = self.dataset.end_indices
+        _start_indices = self.dataset.start_indices
+
+        if not self.shuffle:
+            yield from range(int(_end_indices[-1]) if len(_end_indices) else 0)
+            return
+
+        _generator = np.random.RandomState(self.seed + self.epoch)
+        yield from _shuffle_in_windows(
+            self.dataset,
+            _generator.permutation(len(_end_indices)),
+            self.window,
+            _generator,
+        ).tolist()
+
+    def __len__(self):
+        _end_indices = self.dataset.end_indices
+        return int(_end_indices[-1]) if len(_end_indices) else 0
+
+    def set_epoch(self, epoch):
+        """
+        Set epoch of sampler, each epoch has different order with the same seed.
+
+        Returns:
+            :obj: `None`:
+        """
+        self.epoch = epoch
+
+
+class ShardSampler(torch.utils.data.Sampler):
+    """
+    Sampler of samples of objects assigned to the rank of ``matorage.torch.Dataset`` in sharded mode.
+
+    Every rank yields the same number of samples, because distributed training needs the same number
+    of steps in all ranks. A rank with less samples pads its samples by repeating them from start.
+    ``set_epoch`` changes order of samples, and assignment of objects if `shuffle_shards` of dataset.
+
+    Args:
+        dataset (:obj:`matorage.torch.Dataset`, **require**):
+            dataset in sharded mode.
+        shuffle (:obj:`boolean`, optional, defaults to `True`):
+            if `False`, samples are yielded in order.
+        seed (:obj:`int`, optional, defaults to `0`):
+            random seed, which is added to epoch set by ``set_epoch``.
+        window (:obj:`int`, optional, defaults to `None`):
+            number of objects whose samples are shuffled together like ``LocalitySampler``.
+            If `None`, all samples of the shard are shuffled together.
+
+    .. code-block::
+
+        from torch.utils.data import DataLoader
+        from matorage.torch import Dataset, ShardSampler
+
+        # world size and rank are read from torch.distributed
+        dataset = Dataset(config=data_config, shard=True, shuffle_shards=True)
+        sampler = ShardSampler(dataset, seed=0)
+        loader = DataLoader(dataset, batch_size=64, sampler=sampler)
+
+        for epoch in range(10):
+            sampler.set_epoch(epoch)
+            for image, target in loader:
+                pass
+
+    """
+
+    def __init__(self, dataset, shuffle=True, seed=0, window=None):
+        if window is not None and (not isinstance(window, int) or window < 1):
+            raise ValueError(
+                "window should be a positive integer, not {}".format(window)
+            )
+        self.dataset = dataset
+        self.shuffle = shuffle
+        self.seed = seed
+        self.window = window
+        self.epoch = 0
+
+    def __iter__(self):
+        _objects = np.asarray(self.dataset.get_shard(self.epoch), dtype=np.int64)
+
+        _generator = np.random.RandomState(self.seed + self.epoch)
+        if self.shuffle:
+            _objects = _generator.permutation(_objects)
+        _indices = _shuffle_in_windows(
+            self.dataset, _objects, self.window or max(len(_objects), 1), _generator
+        )
+        if not self.shuffle:
+            _indices.sort()
+
+        # pad to the same number of samples in all ranks.
+        _num_samples = len(self)
+        if len(_indices) < _num_samples:
+            _indices = np.resize(_indices, _num_samples)
+        yield from _indices.tolist()
+
+    def __len__(self):
+        _lengths = self.dataset.end_indices - self.dataset.start_indices
+        return max(
+            int(_lengths[self.dataset.get_shard(self.epoch, rank=_rank)].sum())
+            for _rank in range(self.dataset.world_size)
+        )
+
+    def set_epoch(self, epoch):
+        """
+        Set epoch of sampler, each epoch has different order with the same seed.
+
+        Returns:
+            :obj: `None`:
+        """
+        self.epoch = epoch
@@ -12,11 +12,144 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import os
+from collections import OrderedDict
 from minio import ResponseError
 
 from matorage.connector import MTRConnector
 
+_KB = 1024
+"""The size of a Kilobyte in bytes"""
+
+
+class RangeReader(io.RawIOBase):
+    r""" Readable and seekable stream of an object which reads only requested byte ranges.
+        Bytes are fetched with ranged GET requests in blocks of `block_size`, and the latest
+        `max_blocks` blocks are cached, so small reads of HDF5 metadata are served from few requests.
+        Missing blocks of one read are fetched with a single request.
+
+        Args:
+            client (:obj:`Minio` or :obj:`matorage.nas.NAS`, `require`):
+                storage client.
+            bucket (:obj:`str`, `require`):
+                bucket name.
+            object_name (:obj:`str`, `require`):
+                object name.
+            size (:obj:`integer`, `optional`, defaults to `None`):
+                bytes of object. If `None`, it is get with `stat_object`.
+            block_size (:obj:`integer`, `optional`, defaults to `64KB`):
+                bytes of a block.
+            max_blocks (:obj:`integer`, `optional`, defaults to `32`):
+                number of cached blocks.
+    """
+
+    def __init__(
+        self, client, bucket, object_name, size=None, block_size=64 * _KB, max_blocks=32
+    ):
+        self._client = client
+        self._bucket = bucket
+        self._object_name = object_name
+        self._size = (
+            size if size is not None else client.stat_object(bucket, object_name).size
+        )
+        self._block_size = block_size
+        self._max_blocks = max_blocks
+        self._blocks = OrderedDict()
+        self._offset = 0
+
+        # bytes and number of ranged GET requests.
+        self.bytes_fetched = 0
+        self.requests = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def cached_bytes(self):
+        """
+        Get bytes of cached blocks.
+
+        Returns:
+            :obj:`integer`: bytes of cached blocks
+        """
+        return sum(len(_block) for _block in self._blocks.values())
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._offset = offset
+        elif whence == io.SEEK_CUR:
+            self._offset += offset
+        elif whence == io.SEEK_END:
+            self._offset = self._size + offset
+        else:
+            raise ValueError("invalid whence ({})".format(whence))
+        return self._offset
+
+    def tell(self):
+        return self._offset
+
+    def readinto(self, b):
+        _end = min(self._size, self._offset + len(b))
+        if self._offset >= _end:
+            return 0
+
+        _first = self._offset // self._block_size
+        _last = (_end - 1) // self._block_size
+        self._fetch_blocks(_first, _last)
+
+        _view = memoryview(b).cast("B")
+        _written = 0
+        for _index in range(_first, _last + 1):
+            _block = self._blocks[_index]
+            _block_start = _index * self._block_size
+            _start = max(self._offset, _block_start) - _block_start
+            _stop = min(_end, _block_start + len(_block)) - _block_start
+            _view[_written : _written + _stop - _start] = _block[_start:_stop]
+            _written += _stop - _start
+        self._offset = _end
+        return _written
+
+    def _fetch_blocks(self, first, last):
+        """
+        Fetch blocks from `first` to `last` which are not cached, with one ranged request.
+
+        Returns:
+            :obj: `None`:
+        """
+        _missing = [i for i in range(first, last + 1) if i not in self._blocks]
+        for _index in range(first, last + 1):
+            if _index in self._blocks:
+                self._blocks.move_to_end(_index)
+        if _missing:
+            _start = _missing[0] * self._block_size
+            _stop = min(self._size, (_missing[-1] + 1) * self._block_size)
+            _response = self._client.get_partial_object(
+                self._bucket, self._object_name, offset=_start, length=_stop - _start
+            )
+            try:
+                _data = _response.read()
+            finally:
+                if hasattr(_response, "release_conn"):
+                    _response.release_conn()
+            self.bytes_fetched += len(_data)
+            self.requests += 1
+
+            for _index in range(_missing[0], _missing[-1] + 1):
+                _offset = _index * self._block_size - _start
+                self._blocks[_index] = _data[_offset : _offset + self._block_size]
+                self._blocks.move_to_end(_index)
+
+        # blocks of this read are kept even over `max_blocks`.
+        while len(self._blocks) > max(self._max_blocks, last - first + 1):
+            self._blocks.popitem(last=False)
+
 
 class Downloader(MTRConnector):
     r""" File Storage downloader class with multi thread.
@@ -12,13 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import os
 import shutil
 
 
 class Obj(object):
-    def __init__(self, object_name):
+    def __init__(self, object_name, size=None):
         self.object_name = object_name
+        self.size = size
 
 
 class NAS(object):
@@ -41,6 +43,16 @@ class NAS(object):
         _filename = os.path.join(self.path, bucket_name, object_name)
         return open(_filename, "rb")
 
+    def get_partial_object(self, bucket_name, object_name, offset=0, length=0):
+        _filename = os.path.join(self.path, bucket_name, object_name)
+        with open(_filename, "rb") as f:
+            f.seek(offset)
+            return io.BytesIO(f.read(length) if length else f.read())
+
+    def stat_object(self, bucket_name, object_name):
+        _filename = os.path.join(self.path, bucket_name, object_name)
+        return Obj(object_name, size=os.path.getsize(_filename))
+
     def put_object(self, bucket_name, object_name, data, length, part_size=None):
         _filename = os.path.join(self.path, bucket_name, object_name)
         if not os.path.exists(os.path.dirname(_filename)):
@@ -52,7 +64,16 @@ class NAS(object):
     def list_objects(self, bucket_name, prefix="", recursive=False):
         _foldername = os.path.join(self.path, bucket_name)
         if not recursive:
-            objects = os.listdir(_foldername)
+            # like object storage, prefix `metadata/` lists objects in the folder.
+            _dirname = os.path.dirname(prefix)
+            _folder = os.path.join(_foldername, _dirname)
+            if not os.path.isdir(_folder):
+                return []
+            objects = [
+                os.path.join(_dirname, o)
+                for o in os.listdir(_folder)
+                if os.path.isfile(os.path.join(_folder, o))
+            ]
         else:
             objects = [
                 os.path.join(dp, f) for dp, dn, fn in os.walk(_foldername) for f in fn
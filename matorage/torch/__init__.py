@@ -14,12 +14,15 @@
 
 # Create path shortcut
 from matorage.data.torch.dataset import Dataset
+from matorage.data.torch.sampler import LocalitySampler, ShardSampler
 
 from matorage.model.torch.manager import ModelManager
 from matorage.optimizer.torch.manager import OptimizerManager
 
 __all__ = [
     "Dataset",
+    "LocalitySampler",
+    "ShardSampler",
     "ModelManager",
     "OptimizerManager",
 ]
@@ -26,12 +26,30 @@ class Uploader(MTRConnector):
     """
 
     def __init__(
-        self, client, bucket, num_worker_threads, multipart_upload_size, inmemory=False
+        self,
+        client,
+        bucket,
+        num_worker_threads,
+        multipart_upload_size,
+        inmemory=False,
+        max_queue_size=0,
+        max_queue_bytes=0,
     ):
-        super(Uploader, self).__init__(client, bucket, num_worker_threads)
+        super(Uploader, self).__init__(
+            client,
+            bucket,
+            num_worker_threads,
+            max_queue_size=max_queue_size,
+            max_queue_bytes=max_queue_bytes,
+        )
         self._multipart_upload_size = multipart_upload_size
         self._inmemory = inmemory
 
+    def _get_nbytes(self, local_file):
+        if not self._inmemory:
+            return os.path.getsize(local_file)
+        return super(Uploader, self)._get_nbytes(local_file)
+
     def do_job(self, local_file, remote_file):
 
         if isinstance(remote_file, str):
@@ -46,6 +64,7 @@ class Uploader(MTRConnector):
                 )
                 os.remove(local_file)
             else:
+                # BytesIO shares the bytes object until it is written, no copy.
                 fileimage = io.BytesIO(local_file)
                 self._client.put_object(
                     self._bucket,
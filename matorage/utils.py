@@ -76,6 +76,14 @@ try:
 except (ImportError, AssertionError):
     _tf_available = False  # pylint: disable=invalid-name
 
+try:
+    # importing hdf5plugin registers blosc, lz4 and zstd filters to h5py.
+    import hdf5plugin  # noqa: F401
+
+    _hdf5plugin_available = True  # pylint: disable=invalid-name
+except ImportError:
+    _hdf5plugin_available = False  # pylint: disable=invalid-name
+
 
 def is_torch_available():
     return _torch_available
@@ -85,6 +93,10 @@ def is_tf_available():
     return _tf_available
 
 
+def is_hdf5plugin_available():
+    return _hdf5plugin_available
+
+
 def check_nas(endpoint):
     _url_or_path = "//" + endpoint
     u = urlsplit(_url_or_path)
@@ -12,14 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import copy
+import h5py
+import time
 import unittest
 import numpy as np
 
 from tests.test_data import DataTest
 
 from matorage.data.config import DataConfig
-from matorage.data.saver import DataSaver
+from matorage.data.saver import DataSaver, ParallelDataSaver
 from matorage.data.attribute import DataAttribute
 
 
@@ -156,6 +159,41 @@ class DataSaverTest(DataTest, unittest.TestCase):
             attributes=[DataAttribute("x", "float64", (1))]
         )
 
+    def test_dataconfig_chunk_rows(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_dataconfig_chunk_rows",
+            attributes=[
+                DataAttribute("x", "float64", (2), chunk_rows=4),
+                DataAttribute("y", "float64", (1024), chunk_rows="auto"),
+                DataAttribute("z", "float64", (1)),
+            ],
+            access_pattern="random",
+        )
+        attributes = self.data_config.metadata.to_dict()["attributes"]
+        self.assertEqual([attr["chunk_rows"] for attr in attributes], [4, 2, None])
+
+        self.data_saver = DataSaver(config=self.data_config)
+        self.assertEqual(self.data_saver._earray["x"].chunkshape, (4, 2))
+        self.assertEqual(self.data_saver._earray["y"].chunkshape, (2, 1024))
+
+    def test_dataconfig_chunk_rows_sequential(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_dataconfig_chunk_rows_sequential",
+            attributes=[DataAttribute("y", "float64", (1024), chunk_rows="auto")],
+        )
+        self.assertEqual(self.data_config.attributes[0].chunk_rows, 128)
+
+    def test_dataconfig_chunk_rows_type(self):
+        attribute = DataAttribute("x", "float64", (2), chunk_rows=np.int64(4))
+        self.assertEqual(attribute.chunk_rows, 4)
+        self.assertIs(type(attribute.chunk_rows), int)
+
+        for chunk_rows in [True, 0, 2.0, "4"]:
+            with self.assertRaises(ValueError):
+                DataAttribute("x", "float64", (2), chunk_rows=chunk_rows)
+
     def test_datasaver_string_attribute(self):
         self.data_config = DataConfig(
             **self.storage_config,
@@ -299,6 +337,62 @@ class DataSaverTest(DataTest, unittest.TestCase):
         self.assertEqual(x.shape, (3, 2))
         self.data_saver({"x": x})
 
+    def test_datasaver_inmemory_upload(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_datasaver_inmemory_upload",
+            attributes=[DataAttribute("x", "float64", (2))],
+            max_object_size=32,
+        )
+        self.data_saver = DataSaver(config=self.data_config, inmemory=True)
+        x = np.arange(10, dtype=np.float64).reshape(5, 2)
+        self.data_saver({"x": x})
+        self.data_saver.disconnect()
+
+        client = self.data_saver._client
+        stored = []
+        for _index in self.data_config.metadata.indexer.values():
+            _image = client.get_object(self.data_config.bucket_name, _index["name"])
+            with h5py.File(io.BytesIO(_image.read()), "r") as _file:
+                stored.append(_file["x"][()])
+        self.assertTrue(np.array_equal(np.concatenate(stored), x))
+
+        # file image is uploaded as it is.
+        image = bytes(range(256)) * 1024
+        self.data_saver._uploader.set_queue(local_file=image, remote_file="image")
+        self.data_saver._uploader.join_queue()
+        _image = client.get_object(self.data_config.bucket_name, "image")
+        self.assertEqual(_image.read(), image)
+
+    def test_datasaver_upload_error(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_datasaver_upload_error",
+            attributes=[DataAttribute("x", "float64", (2))],
+        )
+        self.data_saver = DataSaver(config=self.data_config, inmemory=True)
+
+        class FailingClient(object):
+            def put_object(self, *args, **kwargs):
+                raise RuntimeError("storage is broken")
+
+        self.data_saver._uploader._client = FailingClient()
+        self.data_saver({"x": np.zeros((5, 2))})
+        with self.assertRaisesRegex(RuntimeError, "storage is broken"):
+            self.data_saver.disconnect()
+
+        # metadata is not uploaded, and workers survive the error.
+        client = self.data_saver._client
+        _metadata = client.list_objects(
+            self.data_config.bucket_name, prefix="metadata/"
+        )
+        self.assertEqual(list(_metadata), [])
+        self.data_saver._uploader._client = client
+        self.data_saver._uploader.set_queue(local_file=b"image", remote_file="image")
+        self.data_saver._uploader.join_queue()
+        _image = client.get_object(self.data_config.bucket_name, "image")
+        self.assertEqual(_image.read(), b"image")
+
     def test_datasaver_zlib(self):
         for level in range(10):
             self.data_config = DataConfig(
@@ -351,6 +445,270 @@ class DataSaverTest(DataTest, unittest.TestCase):
             self.assertEqual(x.shape, (3, 2))
             self.data_saver({"x": x})
 
+    def test_datasaver_file_rotation(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_datasaver_file_rotation",
+            attributes=[DataAttribute("x", "float64", (2))],
+            max_object_size=32,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        x = np.arange(10, dtype=np.float64).reshape(5, 2)
+        self.data_saver({"x": x})
+        self.data_saver({"x": x})
+        self.data_saver.disconnect()
+
+        indexer = self.data_config.metadata.indexer
+        self.assertEqual(list(indexer.keys()), [2, 4, 6, 8, 10])
+        self.assertEqual([v["length"] for v in indexer.values()], [2, 2, 2, 2, 2])
+
+    def test_datasaver_file_rotation_inmemory(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_datasaver_file_rotation_inmemory",
+            attributes=[DataAttribute("x", "float64", (2))],
+            max_object_size=32,
+        )
+        self.data_saver = DataSaver(config=self.data_config, inmemory=True)
+        x = np.arange(10, dtype=np.float64).reshape(5, 2)
+        self.data_saver({"x": x})
+        self.data_saver({"x": x})
+        self.data_saver.disconnect()
+
+        indexer = self.data_config.metadata.indexer
+        self.assertEqual(list(indexer.keys()), [2, 4, 6, 8, 10])
+        self.assertEqual(len(set(v["name"] for v in indexer.values())), len(indexer))
+
+    def test_datasaver_compressed_file_rotation(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_datasaver_compressed_file_rotation",
+            attributes=[DataAttribute("x", "float64", (64))],
+            compressor={"complevel": 4, "complib": "zlib"},
+            max_object_size=64 * 1024,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        x = np.zeros((200, 64), dtype=np.float64)
+        for _ in range(10):
+            self.data_saver({"x": x})
+        self.data_saver.disconnect()
+
+        lengths = [v["length"] for v in self.data_config.metadata.indexer.values()]
+        # raw size fits 128 rows in one file, compressed files hold more rows.
+        self.assertEqual(lengths[0], 128)
+        self.assertGreater(lengths[1], 128)
+        self.assertEqual(sum(lengths), 2000)
+
+    def test_datasaver_save_from_iterable(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_datasaver_save_from_iterable",
+            attributes=[DataAttribute("x", "float64", (2))],
+            max_object_size=32,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        x = np.arange(10, dtype=np.float64).reshape(5, 2)
+        self.data_saver.save_from_iterable(({"x": x} for _ in range(4)), prefetch=2)
+        self.data_saver.disconnect()
+
+        self.assertEqual(list(self.data_config.metadata.indexer.keys())[-1], 20)
+
+    def test_datasaver_save_from_iterable_error(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_datasaver_save_from_iterable_error",
+            attributes=[DataAttribute("x", "float64", (2))],
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+
+        def generator():
+            yield {"x": np.zeros((2, 2))}
+            raise ValueError("generator is broken")
+
+        with self.assertRaisesRegex(ValueError, "generator is broken"):
+            self.data_saver.save_from_iterable(generator())
+
+    def test_datasaver_save_from_iterable_none_batch(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_datasaver_save_from_iterable_none_batch",
+            attributes=[DataAttribute("x", "float64", (2))],
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        pulled = []
+
+        def generator():
+            yield None
+            while True:
+                pulled.append(1)
+                yield {"x": np.zeros((2, 2))}
+
+        # a None batch is an invalid batch, not the end of the stream.
+        with self.assertRaises(TypeError):
+            self.data_saver.save_from_iterable(generator(), prefetch=2)
+
+        # the producer stops pulling once the consumer has failed.
+        time.sleep(0.5)
+        count = len(pulled)
+        time.sleep(0.5)
+        self.assertEqual(len(pulled), count)
+        self.assertLessEqual(count, 4)
+
+    def test_datasaver_bounded_upload_queue(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_datasaver_bounded_upload_queue",
+            attributes=[DataAttribute("x", "float64", (2))],
+            max_object_size=32,
+        )
+        self.data_saver = DataSaver(
+            config=self.data_config,
+            inmemory=True,
+            num_worker_threads=1,
+            max_queue_size=1,
+            max_queue_bytes=1,
+        )
+        x = np.arange(10, dtype=np.float64).reshape(5, 2)
+        self.data_saver({"x": x})
+        self.data_saver({"x": x})
+        self.data_saver.disconnect()
+
+        self.assertEqual(self.data_saver._uploader.queue_depth, 0)
+        self.assertEqual(self.data_saver._uploader.bytes_in_flight, 0)
+        self.assertEqual(list(self.data_config.metadata.indexer.keys())[-1], 10)
+
+    def test_parallel_datasaver(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_parallel_datasaver",
+            attributes=[DataAttribute("x", "float64", (2))],
+            max_object_size=32,
+        )
+        self.data_saver = ParallelDataSaver(config=self.data_config, num_workers=2)
+        batches = [
+            np.arange(10 * i, 10 * i + 10, dtype=np.float64).reshape(5, 2)
+            for i in range(5)
+        ]
+        self.data_saver.save_from_iterable({"x": x} for x in batches)
+        self.data_saver.disconnect()
+
+        indexer = self.data_config.metadata.indexer
+        self.assertEqual(list(indexer.keys())[-1], 25)
+        self.assertEqual(sum(v["length"] for v in indexer.values()), 25)
+
+        # samples of worker 0(batch 0, 2, 4) are before worker 1(batch 1, 3).
+        client = self.data_saver._client
+        stored = []
+        for _index in indexer.values():
+            _image = client.get_object(self.data_config.bucket_name, _index["name"])
+            with h5py.File(io.BytesIO(_image.read()), "r") as _file:
+                stored.append(_file["x"][()])
+        expected = np.concatenate(batches[0::2] + batches[1::2])
+        self.assertTrue(np.array_equal(np.concatenate(stored), expected))
+
+    def test_datasaver_manifest(self):
+        from matorage.data.manifest import MANIFEST_NAME, load_manifest, read_indexes
+
+        x = np.arange(10, dtype=np.float64).reshape(5, 2)
+        for _ in range(2):
+            self.data_config = DataConfig(
+                **self.storage_config,
+                dataset_name="test_datasaver_manifest",
+                attributes=[DataAttribute("x", "float64", (2))],
+                max_object_size=32,
+            )
+            self.data_saver = DataSaver(config=self.data_config)
+            self.data_saver({"x": x})
+            self.data_saver.disconnect()
+
+        client = self.data_saver._client
+        indexes = read_indexes(client, self.data_config.bucket_name)
+        self.assertEqual(len(indexes), 2)
+        self.assertEqual(load_manifest(client, self.data_config.bucket_name), indexes)
+        self.assertEqual(
+            [_index["length"] for _index in indexes[list(indexes)[0]]], [2, 2, 1]
+        )
+
+        # metadata files which are not in the manifest are still read.
+        client.remove_object(self.data_config.bucket_name, MANIFEST_NAME)
+        self.assertEqual(load_manifest(client, self.data_config.bucket_name), {})
+        self.assertEqual(read_indexes(client, self.data_config.bucket_name), indexes)
+
+    def test_datasaver_attribute_compressor(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_datasaver_attribute_compressor",
+            attributes=[
+                DataAttribute(
+                    "x",
+                    "float64",
+                    (2),
+                    compressor={
+                        "complevel": 5,
+                        "complib": "blosc:lz4",
+                        "bitshuffle": True,
+                    },
+                ),
+                DataAttribute("y", "float64", (2)),
+            ],
+            compressor={"complevel": 1, "complib": "zlib"},
+            compression_threads=2,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.assertEqual(self.data_saver._earray["x"].filters.complib, "blosc:lz4")
+        self.assertTrue(self.data_saver._earray["x"].filters.bitshuffle)
+        self.assertEqual(self.data_saver._earray["y"].filters.complib, "zlib")
+
+        x = np.asarray([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])
+        self.data_saver({"x": x, "y": x})
+
+    def test_dataconfig_compression_threads(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_dataconfig_compression_threads",
+            attributes=[DataAttribute("x", "float64", (2))],
+            compressor={"complevel": 4, "complib": "blosc:lz4"},
+            compression_threads=2,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver({"x": np.arange(10, dtype=np.float64).reshape(5, 2)})
+        self.data_saver.disconnect()
+
+        config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_dataconfig_compression_threads",
+            attributes=[DataAttribute("x", "float64", (2))],
+        )
+        self.assertEqual(config.compression_threads, 2)
+        self.assertEqual(config.to_dict()["compression_threads"], 2)
+
+    def test_dataconfig_compression_threads_type(self):
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_dataconfig_compression_threads_type",
+            attributes=[DataAttribute("x", "float64", (2))],
+            compression_threads=np.int64(2),
+        )
+        self.assertIs(type(self.data_config.compression_threads), int)
+        for compression_threads in [True, 2.0, 0]:
+            with self.assertRaisesRegex(ValueError, "must be positive integer"):
+                DataConfig(
+                    **self.storage_config,
+                    dataset_name="test_dataconfig_compression_threads_type",
+                    attributes=[DataAttribute("x", "float64", (2))],
+                    compression_threads=compression_threads,
+                )
+
+    def test_dataconfig_invalid_compressor(self):
+        with self.assertRaisesRegex(ValueError, "is not valid"):
+            self.data_config = DataConfig(
+                **self.storage_config,
+                dataset_name="test_dataconfig_invalid_compressor",
+                attributes=[
+                    DataAttribute("x", "float64", (2), compressor={"complib": "lz"})
+                ],
+            )
+
     def test_datasaver_nas(self):
 
         self.data_config = DataConfig(
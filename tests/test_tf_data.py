@@ -90,6 +90,37 @@ class TFDataTest(DataTest, unittest.TestCase):
         ):
             pass
 
+    def test_tf_loader_parallel_interleave(self):
+        from matorage.tensorflow import Dataset
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_tf_loader_parallel_interleave",
+            additional={"framework": "tensorflow"},
+            attributes=[DataAttribute("target", "int64", (1))],
+            max_object_size=80,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver({"target": np.arange(96)})
+        self.data_saver.disconnect()
+
+        self.dataset = Dataset(
+            config=self.data_config,
+            batch_size=8,
+            shuffle=True,
+            shuffle_buffer_size=32,
+            cycle_length=4,
+            block_length=2,
+            num_parallel_calls=4,
+            deterministic=False,
+        )
+
+        targets = []
+        for (target,) in self.dataset.dataloader:
+            self.assertEqual(target.shape, (8,))
+            targets.extend(target.numpy().tolist())
+        self.assertEqual(sorted(targets), list(range(96)))
+
     def test_tf_index(self):
         from matorage.tensorflow import Dataset
 
@@ -102,6 +133,45 @@ class TFDataTest(DataTest, unittest.TestCase):
         )
         assert tf.reduce_all(tf.equal(dataset[0][1], tf.constant([0], dtype=tf.uint8)))
 
+    def test_tf_index_dataloader(self):
+        from matorage.tensorflow import Dataset
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_tf_index_dataloader",
+            additional={"framework": "tensorflow"},
+            attributes=[
+                DataAttribute("image", "float32", (2, 2)),
+                DataAttribute("target", "int64", (1)),
+            ],
+            max_object_size=200,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver(
+            {
+                "image": np.arange(400, dtype=np.float32).reshape(100, 2, 2),
+                "target": np.arange(100),
+            }
+        )
+        self.data_saver.disconnect()
+
+        dataset = Dataset(
+            config=self.data_config, index=True, batch_size=8, shuffle=True
+        )
+        self.assertFalse(hasattr(dataset, "cache_path"))
+
+        for _ in range(2):
+            targets = []
+            for image, target in dataset.dataloader:
+                self.assertEqual(image.shape, (8, 2, 2))
+                self.assertEqual(target.shape, (8,))
+                self.assertTrue(
+                    np.array_equal(image.numpy()[:, 0, 0], 4 * target.numpy())
+                )
+                targets.extend(target.numpy().tolist())
+            self.assertEqual(len(targets), 96)
+            self.assertEqual(len(set(targets)), 96)
+
     def test_tf_index_with_compressor(self):
         from matorage.tensorflow import Dataset
 
@@ -12,17 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import time
 import torch
+import shutil
+import tempfile
 import unittest
 import numpy as np
 from tqdm import tqdm
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, default_collate
 
 from tests.test_data import DataTest
 
 from matorage.data.config import DataConfig
 from matorage.data.saver import DataSaver
 from matorage.data.attribute import DataAttribute
+from matorage.utils import is_hdf5plugin_available
 from matorage.testing_utils import require_torch
 
 
@@ -67,6 +72,464 @@ class TorchDataTest(DataTest, unittest.TestCase):
         for batch_idx, (image, target) in enumerate(tqdm(loader)):
             pass
 
+    def test_torch_lazy_loader(self):
+        from matorage.torch import Dataset
+
+        self.test_torch_saver()
+
+        self.dataset = Dataset(config=self.data_config, lazy=True)
+        _local_file = list(self.dataset._object_file_mapper.values())[0]
+        self.assertFalse(os.path.exists(_local_file))
+
+        self.assertEqual(self.dataset[1][1], 1)
+        self.assertTrue(os.path.exists(_local_file))
+
+        loader = DataLoader(self.dataset, batch_size=64, num_workers=2)
+        for batch_idx, (image, target) in enumerate(tqdm(loader)):
+            pass
+
+    def test_torch_cache(self):
+        from matorage.torch import Dataset
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_cache",
+            additional={"framework": "pytorch"},
+            attributes=[DataAttribute("image", "float32", (16, 16))],
+            max_object_size=4096,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver({"image": np.random.rand(40, 16, 16).astype(np.float32)})
+        self.data_saver.disconnect()
+
+        cache_folder_path = tempfile.mkdtemp()
+        try:
+            self.dataset = Dataset(
+                config=self.data_config,
+                cache_folder_path=cache_folder_path,
+                max_cache_size=0,
+            )
+            _local_files = list(self.dataset._object_file_mapper.values())
+            self.assertTrue(all(os.path.exists(_file) for _file in _local_files))
+            self.dataset._exit()
+            self.assertTrue(all(os.path.exists(_file) for _file in _local_files))
+
+            # objects are reused by a next run, and evicted over the budget.
+            _object_size = os.path.getsize(_local_files[0])
+            self.dataset = Dataset(
+                config=self.data_config,
+                cache_folder_path=cache_folder_path,
+                lazy=True,
+                max_cache_size=2 * _object_size,
+            )
+            self.assertEqual(
+                list(self.dataset._object_file_mapper.values()), _local_files
+            )
+            for i in range(len(self.dataset)):
+                self.dataset[i]
+            self.assertLessEqual(
+                sum(os.path.exists(_file) for _file in _local_files), 2
+            )
+        finally:
+            shutil.rmtree(cache_folder_path)
+
+    def test_torch_getitems(self):
+        from matorage.torch import Dataset
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_getitems",
+            additional={"framework": "pytorch"},
+            attributes=[
+                DataAttribute("image", "float32", (2, 2)),
+                DataAttribute("target", "int64", (1)),
+            ],
+            max_object_size=1024,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver(
+            {
+                "image": np.arange(400, dtype=np.float32).reshape(100, 2, 2),
+                "target": np.arange(100),
+            }
+        )
+        self.data_saver.disconnect()
+
+        for index in [False, True]:
+            dataset = Dataset(config=self.data_config, index=index)
+            if not index:
+                self.dataset = dataset
+            indices = [97, 3, 3, 50, 0, 51, 20]
+            image, target = dataset[indices]
+            self.assertEqual(target.tolist(), indices)
+            for i, idx in enumerate(indices):
+                self.assertTrue(torch.equal(image[i], dataset[idx][0]))
+
+            # batches are collated from the same samples as `__getitem__` returns.
+            batches = list(DataLoader(dataset, batch_size=16))
+            samples = default_collate([dataset[i] for i in range(16, 32)])
+            for _batch, _sample in zip(batches[1], samples):
+                self.assertEqual(_batch.dtype, _sample.dtype)
+                self.assertTrue(torch.equal(_batch, _sample))
+            self.assertEqual(batches[-1][0].shape, (4, 2, 2))
+
+            image, target = dataset[[]]
+            self.assertEqual(image.shape, (0, 2, 2))
+            self.assertEqual(target.shape, (0,))
+            self.assertEqual(target.dtype, torch.int64)
+
+    def test_torch_mmap(self):
+        from matorage.torch import Dataset
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_mmap",
+            additional={"framework": "pytorch"},
+            attributes=[
+                DataAttribute("image", "float32", (2, 2), chunk_rows=8),
+                DataAttribute("target", "int64", (1), compressor={"complevel": 4}),
+            ],
+            max_object_size=1024,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver(
+            {
+                "image": np.arange(400, dtype=np.float32).reshape(100, 2, 2),
+                "target": np.arange(100),
+            }
+        )
+        self.data_saver.disconnect()
+
+        self.dataset = Dataset(config=self.data_config, mmap=True)
+        for idx in [0, 7, 8, 63, 99]:
+            image, target = self.dataset[idx]
+            self.assertEqual(target, idx)
+            self.assertTrue(
+                torch.equal(image, torch.arange(4 * idx, 4 * idx + 4.0).view(2, 2))
+            )
+
+        _nodes = next(iter(self.dataset.open_files.values()))["nodes"]
+        self.assertEqual(type(_nodes["image"]).__name__, "_MappedNode")
+        self.assertNotEqual(type(_nodes["target"]).__name__, "_MappedNode")
+
+        indices = [97, 3, 3, 50, 0, 51, 20, 21, 22]
+        image, target = self.dataset[indices]
+        self.assertEqual(target.tolist(), indices)
+        for i, idx in enumerate(indices):
+            self.assertTrue(torch.equal(image[i], self.dataset[idx][0]))
+
+        # samples are copied out of the read-only mapping.
+        self.dataset[1][0].fill_(-1)
+        self.assertEqual(self.dataset[1][0][0, 0].item(), 4.0)
+        self.dataset[[1, 2]][0].fill_(-1)
+        self.assertEqual(self.dataset[[1, 2]][0][0, 0, 0].item(), 4.0)
+
+        with self.assertRaises(ValueError):
+            Dataset(config=self.data_config, mmap=True, index=True)
+
+    def test_torch_max_open_files(self):
+        from matorage.torch import Dataset
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_max_open_files",
+            additional={"framework": "pytorch"},
+            attributes=[DataAttribute("target", "int64", (1))],
+            max_object_size=80,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver({"target": np.arange(95)})
+        self.data_saver.disconnect()
+
+        self.dataset = Dataset(config=self.data_config, max_open_files=2)
+        self.assertEqual(len(self.dataset.open_files), 0)
+        for idx in [0, 94, 10, 50, 11, 70]:
+            self.assertEqual(self.dataset[idx][0], idx)
+            self.assertLessEqual(len(self.dataset.open_files), 2)
+        self.assertGreater(self.dataset.open_files.evictions, 0)
+
+        targets = [
+            target
+            for (target,) in DataLoader(
+                self.dataset, batch_size=8, num_workers=2, shuffle=False
+            )
+        ]
+        self.assertEqual(torch.cat(targets).tolist(), list(range(95)))
+
+        with self.assertRaises(ValueError):
+            Dataset(config=self.data_config, max_open_files=-1)
+
+    def test_torch_locality_sampler(self):
+        from matorage.torch import Dataset, LocalitySampler
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_locality_sampler",
+            additional={"framework": "pytorch"},
+            attributes=[DataAttribute("target", "int64", (1))],
+            max_object_size=80,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver({"target": np.arange(100)})
+        self.data_saver.disconnect()
+
+        self.dataset = Dataset(config=self.data_config)
+        self.assertEqual(len(self.dataset.end_indices), 10)
+
+        sampler = LocalitySampler(self.dataset, window=2, seed=1)
+        first = list(sampler)
+        self.assertEqual(sorted(first), list(range(100)))
+        self.assertEqual(list(sampler), first)
+
+        # every window of samples is from `window` objects.
+        for offset in range(0, 100, 20):
+            self.assertEqual(len(set(i // 10 for i in first[offset : offset + 20])), 2)
+
+        sampler.set_epoch(1)
+        self.assertNotEqual(list(sampler), first)
+
+        loader = DataLoader(self.dataset, batch_size=10, sampler=sampler)
+        self.assertEqual(sum(len(target) for target, in loader), 100)
+
+    def test_torch_index_range_read(self):
+        import h5py
+        from matorage.torch import Dataset
+        from matorage.downloader import RangeReader
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_index_range_read",
+            additional={"framework": "pytorch"},
+            attributes=[DataAttribute("image", "float32", (32, 32))],
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        images = np.random.rand(1000, 32, 32).astype(np.float32)
+        self.data_saver({"image": images})
+        self.data_saver.disconnect()
+
+        dataset = Dataset(config=self.data_config, index=True)
+        self.assertTrue(torch.equal(dataset[777][0], torch.from_numpy(images[777])))
+
+        _objectname = list(dataset.merged_indexer.values())[0]
+        reader = RangeReader(
+            dataset._create_client(), self.data_config.bucket_name, _objectname
+        )
+        with h5py.File(reader, "r") as f:
+            self.assertTrue(np.array_equal(f["image"][500], images[500].reshape(-1)))
+        self.assertLess(reader.bytes_fetched, len(reader) / 4)
+
+    def test_torch_iter_objects_close(self):
+        from matorage.torch import Dataset
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_iter_objects_close",
+            additional={"framework": "pytorch"},
+            attributes=[DataAttribute("target", "int64", (1))],
+            max_object_size=80,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver({"target": np.arange(100)})
+        self.data_saver.disconnect()
+
+        dataset = Dataset(config=self.data_config, index=True)
+        reads = []
+        _read_object = dataset._read_object
+
+        def read_object(objectname):
+            reads.append(objectname)
+            if len(reads) == 2:
+                time.sleep(2)
+            return _read_object(objectname)
+
+        dataset._read_object = read_object
+
+        _object_ids = list(range(len(dataset.object_names)))
+        _objects = dataset._iter_objects(_object_ids, num_prefetch_objects=2)
+        _object_id, _arrays = next(_objects)
+        self.assertEqual(_object_id, 0)
+        self.assertEqual(
+            _arrays["target"].reshape(-1).tolist(),
+            list(range(len(_arrays["target"]))),
+        )
+
+        # closing does not wait for running reads, and no more objects are read.
+        _start = time.time()
+        _objects.close()
+        self.assertLess(time.time() - _start, 1)
+        self.assertEqual(sorted(reads), sorted(dataset.object_names[:3]))
+
+    def test_torch_index_blosc(self):
+        from matorage.torch import Dataset
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_index_blosc",
+            additional={"framework": "pytorch"},
+            attributes=[DataAttribute("target", "int64", (1))],
+            compressor={"complevel": 4, "complib": "blosc:lz4"},
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver({"target": np.arange(10)})
+        self.data_saver.disconnect()
+
+        if is_hdf5plugin_available():
+            dataset = Dataset(config=self.data_config, index=True)
+            self.assertEqual(dataset[7][0].item(), 7)
+        else:
+            with self.assertRaisesRegex(ImportError, "hdf5plugin"):
+                Dataset(config=self.data_config, index=True)
+
+    def test_torch_index_cache(self):
+        from matorage.torch import Dataset
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_index_cache",
+            additional={"framework": "pytorch"},
+            attributes=[DataAttribute("target", "int64", (1))],
+            max_object_size=800,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver({"target": np.arange(300)})
+        self.data_saver.disconnect()
+
+        dataset = Dataset(config=self.data_config, index=True)
+        for i in range(len(dataset)):
+            self.assertEqual(dataset[i][0].item(), i)
+        info = dataset.cache_info()
+        self.assertEqual(info["misses"], 3)
+        self.assertEqual(info["hits"], 297)
+        self.assertEqual(info["objects"], 3)
+
+        dataset = Dataset(config=self.data_config, index=True, max_memory_cache_size=1)
+        for i in [0, 150, 299, 0]:
+            self.assertEqual(dataset[i][0].item(), i)
+        info = dataset.cache_info()
+        self.assertEqual(
+            (info["misses"], info["objects"], info["evictions"]), (4, 1, 3)
+        )
+
+    def test_torch_prefetch_iter(self):
+        from matorage.torch import Dataset, LocalitySampler
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_prefetch_iter",
+            additional={"framework": "pytorch"},
+            attributes=[DataAttribute("target", "int64", (1))],
+            max_object_size=80,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver({"target": np.arange(100)})
+        self.data_saver.disconnect()
+
+        cache_folder_path = tempfile.mkdtemp()
+        try:
+            downloads = []
+
+            def count_downloads(dataset):
+                _client = dataset._get_client()
+                _fget_object = _client.fget_object
+
+                def fget_object(bucket_name, object_name, file_path):
+                    downloads.append(object_name)
+                    return _fget_object(bucket_name, object_name, file_path)
+
+                _client.fget_object = fget_object
+
+            self.dataset = Dataset(
+                config=self.data_config,
+                cache_folder_path=cache_folder_path,
+                lazy=True,
+                max_cache_size=1,
+            )
+            count_downloads(self.dataset)
+
+            indices = list(LocalitySampler(self.dataset, window=2))
+            targets = [
+                target
+                for (target,) in self.dataset.prefetch_iter(indices, batch_size=8)
+            ]
+            self.assertEqual(torch.cat(targets).tolist(), indices)
+            # prefetched objects are pinned over the budget, so each is downloaded once.
+            self.assertEqual(sorted(downloads), sorted(self.dataset.object_names))
+            self.assertEqual(
+                [
+                    _name
+                    for _name in os.listdir(self.dataset._cache.folder)
+                    if _name.endswith(".h5")
+                ],
+                [],
+            )
+
+            samples = list(self.dataset.prefetch_iter(num_prefetch_objects=1))
+            self.assertEqual([target for (target,) in samples], list(range(100)))
+
+            # objects are kept for next iterations if the budget fits the dataset.
+            self.dataset = Dataset(
+                config=self.data_config,
+                cache_folder_path=cache_folder_path,
+                lazy=True,
+                max_cache_size=1 << 30,
+            )
+            count_downloads(self.dataset)
+            del downloads[:]
+            for _ in range(2):
+                samples = list(self.dataset.prefetch_iter(batch_size=8))
+                self.assertEqual(len(samples), 13)
+            self.assertEqual(sorted(downloads), sorted(self.dataset.object_names))
+        finally:
+            shutil.rmtree(cache_folder_path)
+
+    def test_torch_shard(self):
+        from matorage.torch import Dataset, ShardSampler
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_shard",
+            additional={"framework": "pytorch"},
+            attributes=[DataAttribute("target", "int64", (1))],
+            max_object_size=80,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver({"target": np.arange(95)})
+        self.data_saver.disconnect()
+
+        samples = []
+        for rank in range(2):
+            self.dataset = Dataset(
+                config=self.data_config, shard=True, world_size=2, rank=rank
+            )
+            shard = self.dataset.get_shard()
+            _local_files = [
+                self.dataset._object_file_mapper[_name]
+                for _name in self.dataset.object_names
+            ]
+            _downloaded = [
+                _id for _id, _file in enumerate(_local_files) if os.path.exists(_file)
+            ]
+            self.assertEqual(_downloaded, shard)
+
+            sampler = ShardSampler(self.dataset, seed=rank)
+            self.assertEqual(len(sampler), 50)
+            samples.append([self.dataset[i][0] for i in sampler])
+            self.dataset._exit()
+        self.assertEqual(len(samples[0]), len(samples[1]))
+        self.assertEqual(sorted(set(samples[0]) | set(samples[1])), list(range(95)))
+        self.assertFalse(set(samples[0]) & set(samples[1]))
+
+        self.dataset = Dataset(
+            config=self.data_config,
+            shard=True,
+            world_size=2,
+            rank=0,
+            lazy=True,
+            shuffle_shards=True,
+        )
+        shards = [self.dataset.get_shard(epoch) for epoch in range(4)]
+        self.assertTrue(any(shard != shards[0] for shard in shards))
+
     def test_torch_loader_with_compressor(self):
         from matorage.torch import Dataset
 
@@ -124,6 +587,78 @@ class TorchDataTest(DataTest, unittest.TestCase):
         )
         assert torch.equal(dataset[0][1], torch.tensor([0], dtype=torch.uint8))
 
+    def test_torch_object_filter(self):
+        from matorage.torch import Dataset
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_object_filter",
+            additional={"framework": "pytorch"},
+            attributes=[
+                DataAttribute("image", "uint8", (2, 2), itemsize=32),
+                DataAttribute("target", "uint8", (1), itemsize=32),
+            ],
+            statistics=["target"],
+            max_object_size=10,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver(
+            {
+                "image": np.zeros((6, 2, 2), dtype=np.uint8),
+                "target": np.asarray([0, 1, 2, 3, 4, 5], dtype=np.uint8),
+            }
+        )
+        self.data_saver.disconnect()
+
+        statistics = list(self.data_config.metadata.indexer.values())[0]["statistics"]
+        self.assertEqual(statistics["target"]["min"], 0)
+        self.assertEqual(statistics["target"]["max"], 1)
+        self.assertEqual(statistics["target"]["count"], 2)
+
+        self.dataset = Dataset(
+            config=self.data_config, object_filter={"target": {"in": [3, 5]}}
+        )
+        self.assertEqual(len(self.dataset), 4)
+        self.assertEqual([self.dataset[i][1] for i in range(4)], [2, 3, 4, 5])
+
+        self.dataset = Dataset(
+            config=self.data_config, object_filter={"target": {"gt": 3}}
+        )
+        self.assertEqual(len(self.dataset), 2)
+
+    def test_torch_value_index(self):
+        from matorage.torch import Dataset
+
+        self.data_config = DataConfig(
+            **self.storage_config,
+            dataset_name="test_torch_value_index",
+            additional={"framework": "pytorch"},
+            attributes=[
+                DataAttribute("image", "uint8", (2, 2), itemsize=32),
+                DataAttribute("target", "uint8", (1), itemsize=32),
+            ],
+            value_index=["target"],
+            max_object_size=10,
+        )
+        self.data_saver = DataSaver(config=self.data_config)
+        self.data_saver(
+            {
+                "image": np.arange(24, dtype=np.uint8).reshape(6, 2, 2),
+                "target": np.asarray([3, 1, 3, 0, 1, 3], dtype=np.uint8),
+            }
+        )
+        self.data_saver.disconnect()
+
+        dataset = Dataset(config=self.data_config, index=True)
+        subset = dataset.where(target=3)
+        self.assertEqual(list(subset.indices), [0, 2, 5])
+        self.assertEqual([subset[i][1] for i in range(len(subset))], [3, 3, 3])
+        self.assertEqual(list(dataset.where(target=[0, 1]).indices), [1, 3, 4])
+        self.assertEqual(len(dataset.where(target=7)), 0)
+
+        with self.assertRaises(KeyError):
+            dataset.where(image=3)
+
     def test_saver_from_json_file(self):
 
         self.test_torch_saver(save_to_json_file=True)